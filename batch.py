@@ -0,0 +1,311 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import as_completed
+import f1_analysis
+import diagnostics
+import figure_cache
+import figures
+import render
+import session_cache
+import timing
+
+logger = logging.getLogger(__name__)
+
+# Session types in weekend order
+SESSION_TYPES = ["FP1", "FP2", "FP3", "Sprint Qualifying", "Qualifying", "Sprint Race", "Race"]
+
+# Plot argument kinds that need a driver pair
+PAIR_ARGS = {render.DRIVER_PAIR, render.MINI_SECTORS, render.DRIVER_LIST}
+
+MANIFEST = ".batch_manifest.json"
+
+
+'''------------------------------------------------------------------------------------'''
+
+'''PLANNING'''
+
+# "2022-2024" or "2024" -> [2022, 2023, 2024] or [2024]
+def parse_years(values):
+    years = []
+    for value in values:
+        first, _, last = value.partition("-")
+        years.extend(range(int(first), int(last or first) + 1))
+    return sorted(set(years))
+
+
+# "VER:LEC" -> ("VER", "LEC")
+def parse_pair(value):
+    driver1, sep, driver2 = value.upper().partition(":")
+    if not sep or not driver1 or not driver2:
+        raise argparse.ArgumentTypeError(f"driver pair must look like VER:LEC, got '{value}'")
+    return driver1, driver2
+
+
+# "VER,LEC,NOR" -> ["VER", "LEC", "NOR"], "ALL" -> None (the whole grid)
+def parse_group(value):
+    if value.upper() == "ALL":
+        return None
+    drivers = [name for name in value.upper().split(",") if name]
+    if len(drivers) < 2:
+        raise argparse.ArgumentTypeError(f"driver group must look like VER,LEC,NOR or ALL, got '{value}'")
+    return drivers
+
+
+# Grand Prix names of a season, as accepted by load_session
+def season_grands_prix(year):
+    import fastf1
+    session_cache.ensure_cache()
+    schedule = fastf1.get_event_schedule(year, include_testing=False)
+    return list(schedule["Location"])
+
+
+# Jobs of a session as (plot_name, args, filename); plots comparing drivers are repeated for every pair,
+# multi-driver plots for every group
+def session_jobs(session_type, pairs, n_minisectors=25, groups=()):
+    jobs = []
+    for _, plot_name, arg_kind, filename in render.SESSION_PLOTS.get(session_type, []):
+        if arg_kind in render.GROUP_ARGS:
+            for drivers in groups:
+                args = render.plot_args(arg_kind, None, None, n_minisectors, drivers)
+                jobs.append((plot_name, args, f"{filename}_{'_'.join(drivers) if drivers else 'ALL'}"))
+            continue
+        if arg_kind not in PAIR_ARGS:
+            jobs.append((plot_name, render.plot_args(arg_kind, None, None), filename))
+            continue
+        for driver1, driver2 in pairs:
+            args = render.plot_args(arg_kind, driver1, driver2, n_minisectors)
+            jobs.append((plot_name, args, f"{filename}_{driver1}_{driver2}"))
+    return jobs
+
+
+# Folder holding the figures of a session
+def session_dir(out_dir, year, grand_prix, session_type):
+    return os.path.join(out_dir, str(year), grand_prix.replace(" ", "_"), session_type.replace(" ", "_"))
+
+
+# Fingerprint of an output file. It changes when the plot, its arguments, the render profile,
+# the plot settings or figure_cache.CACHE_VERSION change, which makes the file out of date
+def output_key(year, grand_prix, session_type, plot_name, args, profile):
+    session_name = f"{year}/{grand_prix}/{session_type}"
+    return figure_cache.figure_key(session_name, plot_name, args, f1_analysis.RENDER_PROFILES[profile], f1_analysis.plot_settings())
+
+
+def read_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(folder, manifest):
+    path = os.path.join(folder, MANIFEST)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# Jobs whose output is missing or was drawn with other settings, as (plot_name, args, filename, key)
+def pending_jobs(folder, year, grand_prix, session_type, jobs, profile, force=False):
+    file_format = f1_analysis.RENDER_PROFILES[profile]["format"]
+    manifest = read_manifest(folder)
+
+    pending = []
+    for plot_name, args, filename in jobs:
+        key = output_key(year, grand_prix, session_type, plot_name, args, profile)
+        path = os.path.join(folder, f"{filename}.{file_format}")
+        if force or manifest.get(filename) != key or not os.path.isfile(path):
+            pending.append((plot_name, args, filename, key))
+    return pending
+
+
+'''------------------------------------------------------------------------------------'''
+
+'''RENDERING'''
+
+# Runs in a worker: load one session and write its pending figures to folder.
+# Returns a summary dict, a failed plot doesn't stop the others. The stages are timed in the log,
+# and profiled with F1_PROFILE. With force, every figure is drawn again, without the figure cache of the app
+def render_session(year, grand_prix, session_type, jobs, folder, profile, force=False):
+    label = f"{year} {grand_prix} {session_type}"
+    with timing.profile(label), timing.collect() as spans:
+        result = _render_session(year, grand_prix, session_type, jobs, folder, profile, force)
+    timing.report(spans, label, result["elapsed_s"])
+    figures.memory_report(label)
+    return result
+
+def _render_session(year, grand_prix, session_type, jobs, folder, profile, force=False):
+    start = time.perf_counter()
+    result = {"written": 0, "empty": [], "errors": [], "warnings": [], "available": True}
+
+    plot_funcs = [getattr(f1_analysis, plot_name) for plot_name, _, _, _ in jobs]
+    requirements = f1_analysis.plot_requirements(plot_funcs)
+
+    # Every session is used once, so skip the in-memory session cache
+    with diagnostics.collect() as events:
+        session = f1_analysis.load_session("Grand Prix", year, grand_prix, session_type, requirements)
+    result["warnings"].extend(diagnostics.plain_messages(events))
+    if session is None:
+        result["available"] = False
+        result["elapsed_s"] = time.perf_counter() - start
+        return result
+
+    file_format = f1_analysis.RENDER_PROFILES[profile]["format"]
+    os.makedirs(folder, exist_ok=True)
+    manifest = read_manifest(folder)
+
+    for plot_name, args, filename, key in jobs:
+        try:
+            data, stats = render.render_plot(session, plot_name, args, profile, filename, use_cache=not force)
+        except Exception as e:
+            logger.exception("Could not draw %s", filename)
+            result["errors"].append(f"{filename}: {e}")
+            continue
+
+        result["warnings"].extend(f"{filename}: {message}" for message in diagnostics.plain_messages(stats["events"]))
+
+        if data is None:
+            # Nothing to show, e.g. a driver without a timed lap
+            result["empty"].append(filename)
+            continue
+
+        path = os.path.join(folder, f"{filename}.{file_format}")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        manifest[filename] = key
+        result["written"] += 1
+
+    write_manifest(folder, manifest)
+    result["elapsed_s"] = time.perf_counter() - start
+    return result
+
+
+def _report(done, total, label, result):
+    if not result["available"]:
+        print(f"[{done}/{total}] {label}: not available")
+        for warning in result["warnings"]:
+            print(f"    {warning}")
+        return
+
+    line = f"[{done}/{total}] {label}: {result['written']} figures in {result['elapsed_s']:.1f} s"
+    if result["empty"]:
+        line += f", nothing to show for {', '.join(result['empty'])}"
+    print(line)
+    for warning in result["warnings"]:
+        print(f"    warning: {warning}")
+    for error in result["errors"]:
+        print(f"    error: {error}")
+
+
+# Render every selected session, workers sessions at a time. Returns the run totals
+def run_batch(years, grands_prix, session_types, pairs, out_dir, profile=None, n_minisectors=25, workers=None, force=False, groups=()):
+    profile = profile or f1_analysis.DEFAULT_PROFILE
+    workers = render.RENDER_WORKERS if workers is None else workers
+    start = time.perf_counter()
+    totals = {"sessions": 0, "unavailable": 0, "up_to_date": 0, "figures": 0, "skipped_figures": 0, "errors": 0}
+
+    # Plan first, so up to date sessions are skipped without loading anything
+    tasks = []
+    for year in years:
+        for grand_prix in grands_prix or season_grands_prix(year):
+            for session_type in session_types:
+                jobs = session_jobs(session_type, pairs, n_minisectors, groups)
+                if not jobs:
+                    continue
+
+                folder = session_dir(out_dir, year, grand_prix, session_type)
+                pending = pending_jobs(folder, year, grand_prix, session_type, jobs, profile, force)
+                totals["skipped_figures"] += len(jobs) - len(pending)
+                if not pending:
+                    totals["up_to_date"] += 1
+                    continue
+
+                tasks.append((f"{year} {grand_prix} {session_type}", (year, grand_prix, session_type, pending, folder, profile, force)))
+
+    print(f"{len(tasks)} sessions to render, {totals['up_to_date']} already up to date")
+
+    def collect(done, label, result):
+        _report(done, len(tasks), label, result)
+        if not result["available"]:
+            totals["unavailable"] += 1
+            return
+        totals["sessions"] += 1
+        totals["figures"] += result["written"]
+        totals["errors"] += len(result["errors"])
+
+    if workers <= 1 or len(tasks) <= 1:
+        for done, (label, task) in enumerate(tasks, start=1):
+            collect(done, label, render_session(*task))
+    else:
+        pool = render.new_pool(min(workers, len(tasks)))
+        try:
+            futures = {pool.submit(render_session, *task): label for label, task in tasks}
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"written": 0, "empty": [], "errors": [str(e)], "warnings": [], "available": True, "elapsed_s": 0.0}
+                collect(done, futures[future], result)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    totals["elapsed_s"] = time.perf_counter() - start
+    minutes = totals["elapsed_s"] / 60
+    totals["sessions_per_min"] = totals["sessions"] / minutes if minutes else 0.0
+    totals["figures_per_min"] = totals["figures"] / minutes if minutes else 0.0
+    return totals
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Render the F1 Analysis plots of many sessions to files, without the web app.")
+    parser.add_argument("--years", nargs="+", required=True, help="years or ranges, e.g. 2024 or 2022-2024")
+    parser.add_argument("--gp", nargs="+", dest="grands_prix", help="Grand Prix names, e.g. Monaco Italy (default: every event of the season)")
+    parser.add_argument("--sessions", nargs="+", default=SESSION_TYPES, choices=SESSION_TYPES, metavar="SESSION",
+                        help=f"session types (default: all of {', '.join(SESSION_TYPES)})")
+    parser.add_argument("--drivers", nargs="+", type=parse_pair, default=[], metavar="D1:D2",
+                        help="driver pairs for the comparison plots, e.g. VER:LEC NOR:PIA (without pairs these plots are skipped)")
+    parser.add_argument("--group", action="append", type=parse_group, default=[], dest="groups", metavar="D1,D2,...",
+                        help="driver group for the multi-driver plots, e.g. VER,LEC,NOR or ALL; repeat for more groups (without groups these plots are skipped)")
+    parser.add_argument("--minisectors", type=int, default=25, help="mini-sectors of the track dominance plot")
+    parser.add_argument("--profile", default=f1_analysis.DEFAULT_PROFILE, choices=list(f1_analysis.RENDER_PROFILES),
+                        help="render profile of the files")
+    parser.add_argument("--out", default="output", help="output folder (default: ./output)")
+    parser.add_argument("--workers", type=int, default=render.RENDER_WORKERS, help="sessions rendered at the same time")
+    parser.add_argument("--force", action="store_true", help="render again figures that are up to date, also ignoring the figure cache of the app")
+    parser.add_argument("--cache-dir", help="fastf1 cache folder")
+    parser.add_argument("--offline", action="store_true", help="only use sessions already in the cache")
+    parser.add_argument("--verbose", action="store_true", help="show fastf1 and cache logs")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    # Workers are started with these settings
+    session_cache.configure_cache(args.cache_dir, offline=args.offline or None)
+
+    totals = run_batch(
+        parse_years(args.years), args.grands_prix, args.sessions, args.drivers, args.out,
+        args.profile, args.minisectors, args.workers, args.force, args.groups
+    )
+
+    print(
+        f"Rendered {totals['figures']} figures of {totals['sessions']} sessions in {totals['elapsed_s']:.1f} s "
+        f"({totals['sessions_per_min']:.1f} sessions/min, {totals['figures_per_min']:.1f} figures/min); "
+        f"{totals['skipped_figures']} figures up to date, {totals['unavailable']} sessions not available, "
+        f"{totals['errors']} errors"
+    )
+    return 1 if totals["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
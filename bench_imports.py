@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# What each cold start pays: Python code run in a fresh interpreter and timed from inside
+TARGETS = {
+    "gui": "import gui",
+    "f1_analysis": "import f1_analysis",
+    "render": "import render",
+    "batch": "import batch",
+    "preloaded": "import f1_analysis; f1_analysis.preload_modules()",
+}
+
+# Slower than the baseline by more than this is reported as a regression
+DEFAULT_TOLERANCE = 0.20
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+# Seconds taken by code in a new interpreter started in the project folder
+def time_cold(code):
+    script = f"import time\nstart = time.perf_counter()\n{code}\nprint(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+# Modules imported by code with their cumulative time in seconds, from python -X importtime.
+# Only the modules code imports and what they import directly, deeper ones are counted in their parent
+def _import_times(code):
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+
+    times = {}
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+# Slowest imports of code as [(cumulative_s, module)], without the ones of the interpreter startup
+def slowest_modules(code, top=10):
+    startup = _import_times("pass")
+    modules = [(seconds, name) for name, seconds in _import_times(code).items() if name not in startup]
+    return sorted(modules, reverse=True)[:top]
+
+
+def run(targets, repeat):
+    results = {}
+    for name in targets:
+        samples = [time_cold(TARGETS[name]) for _ in range(repeat)]
+        results[name] = {"median_s": statistics.median(samples), "min_s": min(samples), "samples": samples}
+        print(f"{name:<12} median {results[name]['median_s'] * 1000:8.1f} ms   min {results[name]['min_s'] * 1000:8.1f} ms")
+    return results
+
+
+# Targets slower than the baseline median by more than tolerance, as [(name, baseline_s, now_s)]
+def regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    slower = []
+    for name, result in results.items():
+        if name in baseline and result["median_s"] > baseline[name]["median_s"] * (1 + tolerance):
+            slower.append((name, baseline[name]["median_s"], result["median_s"]))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the cold import time of the app modules.")
+    parser.add_argument("targets", nargs="*", metavar="TARGET", help=f"what to import (default: all of {', '.join(TARGETS)})")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per target")
+    parser.add_argument("--save", metavar="JSON", help="write the results, e.g. to use them as a baseline")
+    parser.add_argument("--baseline", metavar="JSON", help="compare with saved results, exit with 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown against the baseline (0.2 = 20%%)")
+    parser.add_argument("--modules", action="store_true", help="also list the slowest imports of every target")
+    args = parser.parse_args(argv)
+
+    args.targets = args.targets or list(TARGETS)
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+
+    results = run(args.targets, args.repeat)
+
+    if args.modules:
+        for name in args.targets:
+            print(f"\nSlowest imports of {name}:")
+            for seconds, module in slowest_modules(TARGETS[name]):
+                print(f"  {seconds * 1000:8.1f} ms  {module}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = regressions(results, baseline, args.tolerance)
+        for name, before, now in slower:
+            print(f"REGRESSION {name}: {before * 1000:.1f} ms -> {now * 1000:.1f} ms")
+        if slower:
+            return 1
+        print("No regression against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+# Sessions the suite runs against, replayed offline from the fastf1 cache in FIXTURES_DIR
+FIXTURES = {
+    "qualifying": (2024, "Monaco", "Qualifying"),
+    "race": (2024, "Monaco", "Race"),
+    "sprint": (2024, "Austin", "Sprint Race"),
+    "fp": (2024, "Monaco", "FP2"),
+}
+
+# Recorded once with --record (network needed), then used without any network access
+FIXTURES_DIR = os.environ.get("F1_BENCH_FIXTURES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_fixtures"))
+
+# Drivers of the multi-driver plots, the fastest ones of the session
+GROUP_SIZE = 5
+
+# Slower than the baseline by more than this is reported as a regression, same for peak memory
+DEFAULT_TOLERANCE = 0.20
+
+
+def _setup(record=False):
+    import session_cache
+    import figure_cache
+    import render
+
+    logging.basicConfig(level=logging.WARNING)
+    session_cache.configure_cache(FIXTURES_DIR, offline=not record)
+    # Figures are always drawn, never read back from a previous run
+    figure_cache.configure_figure_cache(tempfile.mkdtemp(prefix="bench_figures_"))
+    # In this process, so the timings don't depend on the number of cores
+    render.RENDER_WORKERS = 0
+
+
+# Drivers by best lap and the plots of a session type as [(plot_name, args)], drawn for the fastest drivers.
+# The multi-driver plots compare the group_size fastest ones, None for all of them
+def fixture_plots(session, session_type, group_size=GROUP_SIZE):
+    import f1_analysis
+    import render
+
+    drivers = list(f1_analysis.session_summary(session)["drivers"]["Driver"])
+    plots = []
+    for _, plot_name, arg_kind, _ in render.SESSION_PLOTS.get(session_type, []):
+        plots.append((plot_name, render.plot_args(arg_kind, drivers[0], drivers[1], 25, drivers[:group_size])))
+    return drivers, plots
+
+
+# Seconds taken by func() and its peak traced memory in MB (numpy and pandas buffers included).
+# Peak memory comes from a separate traced call, tracing slows everything down
+def measure(func, trace=False):
+    if not trace:
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start, None
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return None, peak / 1024 / 1024
+
+
+class FixtureMissing(RuntimeError):
+    pass
+
+
+# One pass over a fixture on a fresh session: load from the cache, every plot, its encoding,
+# then the whole app request. Returns {stage: seconds or MB}
+def run_pass(fixture, trace=False):
+    import streamlit as st
+    import f1_analysis
+    import figure_cache
+    import figures
+    import render
+    import session_cache
+    import gui
+
+    year, grand_prix, session_type = FIXTURES[fixture]
+    results = {}
+
+    def record(stage, func):
+        seconds, peak_mb = measure(func, trace)
+        results[stage] = peak_mb if trace else seconds
+
+    # Same data as the app loads for this session type
+    requirements = f1_analysis.plot_requirements([getattr(f1_analysis, plot_name) for _, plot_name, _, _ in render.SESSION_PLOTS.get(session_type, [])])
+    loaded = {}
+    record("load_session", lambda: loaded.setdefault("session", f1_analysis.load_session("Grand Prix", year, grand_prix, session_type, requirements)))
+    session = loaded["session"]
+    if session is None:
+        raise FixtureMissing(f"{year} {grand_prix} {session_type} is not in {FIXTURES_DIR}, record it with --record")
+
+    drivers, plots = fixture_plots(session, session_type)
+    for plot_name, args in plots:
+        drawn = {}
+        plot_func = getattr(f1_analysis, plot_name)
+        record(f"plot:{plot_name}", lambda: drawn.setdefault("fig", plot_func(session, *args)))
+        with figures.closing(drawn["fig"]) as fig:
+            if fig is not None:
+                record(f"encode:{plot_name}", lambda: f1_analysis.figure_bytes(fig))
+
+    # The request of the app, with the session out of the memory cache and every figure drawn:
+    # the figure cache still holds the ones of the previous pass
+    session_cache.SESSIONS.clear()
+    figure_cache.clear()
+    group = ", ".join(drivers[2:GROUP_SIZE])
+    record("on_load_session", lambda: gui.on_load_session("Grand Prix", year, grand_prix, session_type, drivers[0], drivers[1], 25, group))
+    session_cache.SESSIONS.clear()
+
+    cached = [stats["figure"] for stats in st.session_state.get("render_stats", []) if stats.get("cache_hit")]
+    if cached:
+        raise RuntimeError(f"on_load_session served {', '.join(cached)} from the figure cache, the timing would not draw them")
+    return results
+
+
+# Median and min seconds of repeat passes and the peak memory of one traced pass, by "fixture/stage".
+# Fixtures that were never recorded are left out with a message
+def run(fixtures, repeat):
+    results = {}
+    for fixture in fixtures:
+        try:
+            samples = [run_pass(fixture)]
+        except FixtureMissing as e:
+            print(f"{fixture}: skipped, {e}")
+            continue
+        samples += [run_pass(fixture) for _ in range(repeat - 1)]
+        peaks = run_pass(fixture, trace=True)
+
+        for stage in samples[0]:
+            times = [sample[stage] for sample in samples]
+            name = f"{fixture}/{stage}"
+            results[name] = {"median_s": statistics.median(times), "min_s": min(times), "peak_mb": peaks.get(stage), "samples": times}
+            print(f"{name:<48} median {results[name]['median_s'] * 1000:9.1f} ms   min {results[name]['min_s'] * 1000:9.1f} ms   peak {results[name]['peak_mb'] or 0:8.1f} MB")
+    return results
+
+
+# Loads every fixture with all its data, so the fastf1 cache of FIXTURES_DIR has everything the suite reads
+def record_fixtures(fixtures):
+    import f1_analysis
+    import figures
+
+    for fixture in fixtures:
+        year, grand_prix, session_type = FIXTURES[fixture]
+        session = f1_analysis.load_session("Grand Prix", year, grand_prix, session_type)
+        print(f"{fixture}: {year} {grand_prix} {session_type} {'recorded' if session is not None else 'NOT AVAILABLE'}")
+        if session is not None:
+            # Also saves the summary tables and the telemetry store next to the session
+            for plot_name, args in fixture_plots(session, session_type)[1]:
+                figures.close_figure(getattr(f1_analysis, plot_name)(session, *args))
+
+
+# Stages slower or heavier than the baseline by more than tolerance, as [(name, what, baseline, now)]
+def regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    worse = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        if result["median_s"] > baseline[name]["median_s"] * (1 + tolerance):
+            worse.append((name, "time", baseline[name]["median_s"], result["median_s"]))
+        if result["peak_mb"] is not None and baseline[name].get("peak_mb") and result["peak_mb"] > baseline[name]["peak_mb"] * (1 + tolerance):
+            worse.append((name, "memory", baseline[name]["peak_mb"], result["peak_mb"]))
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time session loading, every plot, figure encoding and the app request on fixture sessions.")
+    parser.add_argument("fixtures", nargs="*", metavar="FIXTURE", help=f"sessions to run (default: all of {', '.join(FIXTURES)})")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes per fixture")
+    parser.add_argument("--record", action="store_true", help=f"download the fixtures into {FIXTURES_DIR} (F1_BENCH_FIXTURES) instead")
+    parser.add_argument("--save", metavar="JSON", help="write the results, e.g. to use them as a baseline")
+    parser.add_argument("--baseline", metavar="JSON", help="compare with saved results, exit with 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown and memory growth against the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    args.fixtures = args.fixtures or list(FIXTURES)
+    unknown = set(args.fixtures) - set(FIXTURES)
+    if unknown:
+        parser.error(f"unknown fixtures: {', '.join(sorted(unknown))}")
+
+    _setup(record=args.record)
+    if args.record:
+        record_fixtures(args.fixtures)
+        return 0
+
+    results = run(args.fixtures, args.repeat)
+    if not results:
+        print(f"Nothing to time: record the fixtures first with --record (network needed, stored in {FIXTURES_DIR})")
+        return 2
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline and not os.path.isfile(args.baseline):
+        # First run on this machine: nothing to compare with yet
+        print(f"No baseline at {args.baseline}, skipping the comparison (write one with --save {args.baseline})")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        worse = regressions(results, baseline, args.tolerance)
+        for name, what, before, now in worse:
+            unit, scale = ("ms", 1000) if what == "time" else ("MB", 1)
+            print(f"REGRESSION {name} ({what}): {before * scale:.1f} {unit} -> {now * scale:.1f} {unit}")
+        if worse:
+            return 1
+        print("No regression against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
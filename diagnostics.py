@@ -0,0 +1,51 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+# Events recorded by the core are dicts: {"level": "warning" | "info", "message": str, **details}.
+# Messages may use markdown (**bold**), the Streamlit layer shows them as is
+def _emit(level, message, details):
+    event = {"level": level, "message": message, **details}
+
+    collectors = getattr(_local, "collectors", None)
+    if collectors:
+        collectors[-1].append(event)
+    else:
+        # Nobody is listening (e.g. a script), don't lose the message
+        logger.log(logging.WARNING if level == "warning" else logging.INFO, message)
+    return event
+
+
+# Something the user should know about, e.g. a driver without laps
+def warn(message, **details):
+    return _emit("warning", message, details)
+
+
+def info(message, **details):
+    return _emit("info", message, details)
+
+
+# Collect the events recorded by this thread inside the block:
+#   with diagnostics.collect() as events:
+#       fig = plot(...)
+@contextmanager
+def collect():
+    events = []
+    if not hasattr(_local, "collectors"):
+        _local.collectors = []
+
+    _local.collectors.append(events)
+    try:
+        yield events
+    finally:
+        _local.collectors.pop()
+
+
+# Event messages without markdown, for plain text output
+def plain_messages(events):
+    return [event["message"].replace("**", "") for event in events]
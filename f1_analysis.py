@@ -1,19 +1,22 @@
-import fastf1
-import fastf1.plotting
 import matplotlib
-import matplotlib.pyplot as plt
+import matplotlib.style
 from matplotlib.patches import Patch
-from matplotlib.ticker import MultipleLocator
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+import matplotlib.colors as mcolors
 import matplotlib.gridspec as gridspec
 from matplotlib.ticker import MaxNLocator
 import numpy as np
-import gui
-import seaborn as sns
 from collections import defaultdict
-from scipy.interpolate import interp1d
-import streamlit as st
 import pandas as pd
-from datetime import datetime
+import session_cache
+import diagnostics
+import figures
+import timing
+import threading
+import io
+import os
+import functools
 
 # Define team colors
 TEAM_COLORS = {
@@ -40,80 +43,493 @@ TEAM_COLORS = {
     "AlphaTauri": "#2B4562"
 }
 
+# Session types of the app and their fastf1 names
+SESSION_NAMES = {
+    "FP1": "FP1",
+    "FP2": "FP2",
+    "FP3": "FP3",
+    "Sprint Qualifying": "Sprint Qualifying",
+    "Qualifying": "Qualifying",
+    "Sprint Race": "Sprint",
+    "Race": "Race"
+}
 
-# Load F1 session data dynamically from GUI selections
-def load_session(mode, year, grand_prix, session_type):
+# Session data a plot can depend on
+LAPS = "laps"
+TELEMETRY = "telemetry"
+CIRCUIT = "circuit"
+ALL_DATA = frozenset({LAPS, TELEMETRY, CIRCUIT})
+
+_upgrade_lock = threading.Lock()
+
+# Render profiles: resolution and file format of a figure for each use.
+# Plots are drawn at the screen profile, the others are only used when saving a download
+RENDER_PROFILES = {
+    "screen": {"dpi": int(os.environ.get("F1_SCREEN_DPI", "100")), "format": "png"},
+    "download": {"dpi": int(os.environ.get("F1_DOWNLOAD_DPI", "300")), "format": "png"},
+    "print": {"dpi": int(os.environ.get("F1_PRINT_DPI", "600")), "format": "pdf"},
+    "vector": {"dpi": 100, "format": "svg"},
+}
+DEFAULT_PROFILE = "screen"
+
+# Resolution of a render profile (None means the default profile)
+def profile_dpi(profile=None):
+    return RENDER_PROFILES[profile or DEFAULT_PROFILE]["dpi"]
+
+# Encode a figure with the resolution and format of a render profile
+def figure_bytes(fig, profile=None):
+    settings = RENDER_PROFILES[profile or DEFAULT_PROFILE]
+    buf = io.BytesIO()
+    with timing.span("savefig"):
+        fig.savefig(buf, format=settings["format"], dpi=settings["dpi"], bbox_inches="tight")
+    return buf.getvalue()
+
+# fastf1 and seaborn are imported by the functions using them, so importing this module stays cheap.
+# Call this (e.g. from a background thread) to pay for them before the first session is requested
+def preload_modules():
+    import fastf1
+    import seaborn
+
+# Draw a plot with the dark theme. The style only lives for the call, so plots
+# don't depend on global pyplot state and can run in worker processes
+def dark_style(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with matplotlib.style.context("dark_background"):
+            return func(*args, **kwargs)
+    return wrapper
+
+# Declare the session data a plot function reads. Every call of the plot is timed as a span
+def requires(*needs):
+    def decorator(func):
+        func = timing.timed()(func)
+        func.requirements = frozenset(needs)
+        return func
+    return decorator
+
+# Union of the data needed by a list of plot functions
+def plot_requirements(plot_funcs):
+    needs = set()
+    for func in plot_funcs:
+        needs |= getattr(func, "requirements", ALL_DATA)
+    return frozenset(needs)
+
+# fastf1 load() flags covering the requested data. Race control messages always come with the laps:
+# fastf1 needs them to mark the laps deleted for track limits (Deleted, not IsPersonalBest),
+# otherwise pick_fastest() and the personal bests can return laps that don't count
+def _load_kwargs(requirements):
+    # Circuit info places the corners using the fastest lap's position data
+    telemetry = TELEMETRY in requirements or CIRCUIT in requirements
+    return dict(laps=True, telemetry=telemetry, weather=False, messages=True)
+
+# Load the missing data of a partially loaded session, returns True if something was loaded
+def ensure_session_data(session, requirements):
+    with _upgrade_lock:
+        loaded = getattr(session, "loaded_data", ALL_DATA)
+        missing = frozenset(requirements) - loaded
+        if not missing:
+            return False
+
+        needed = loaded | missing
+        if _load_kwargs(needed) != _load_kwargs(loaded):
+            with timing.span("ensure_session_data.load"):
+                session_cache.load_cached(session, **_load_kwargs(needed))
+        session.loaded_data = needed
+        return True
+
+# Load F1 session data dynamically from GUI selections.
+# requirements limits loading to the data the plots need (everything by default)
+@timing.timed()
+def load_session(mode, year, grand_prix, session_type, requirements=None):
     if mode != "Grand Prix":
         return None
 
-    session_mapping = {
-        "FP1": "FP1",
-        "FP2": "FP2",
-        "FP3": "FP3",
-        "Sprint Qualifying": "Sprint Qualifying",
-        "Qualifying": "Qualifying",
-        "Sprint Race": "Sprint",
-        "Race": "Race"
-    }
-
     if not all([year, grand_prix, session_type]):
         return None
 
+    import fastf1
+    session_cache.ensure_cache()
+
     try:
-        event = fastf1.get_event(int(year), grand_prix)
+        with timing.span("load_session.get_event"):
+            event = fastf1.get_event(int(year), grand_prix)
     except Exception:
-        st.warning(f"Could not find any event for '{grand_prix}' in {year}.")
+        diagnostics.warn(f"Could not find any event for '{grand_prix}' in {year}.")
         return None
 
     if event.Country != grand_prix and event.Location != grand_prix:
-        st.warning(f"{grand_prix} **did not host** a race weekend in {year}.")
+        diagnostics.warn(f"{grand_prix} **did not host** a race weekend in {year}.")
         return None
 
     # Try to load the session directly
     try:
-        session = fastf1.get_session(int(year), grand_prix, session_mapping[session_type])
-        session.load()
+        with timing.span("load_session.get_session"):
+            session = fastf1.get_session(int(year), grand_prix, SESSION_NAMES[session_type])
+        # fastf1 download (or cache read) and parsing
+        with timing.span("load_session.load"):
+            if requirements is None:
+                session_cache.load_cached(session)
+                session.loaded_data = ALL_DATA
+            else:
+                session_cache.load_cached(session, **_load_kwargs(requirements))
+                session.loaded_data = frozenset(requirements) | {LAPS}
 
         # Check if data is available
         if session.laps.empty:
-            st.warning(f"{session_type} session **is not available yet** or was not held during the {grand_prix} GP in {year}.")
+            diagnostics.warn(f"{session_type} session **is not available yet** or was not held during the {grand_prix} GP in {year}.")
             return None
 
+        with timing.span("load_session.summary"):
+            session_summary(session)
         return session
 
     except Exception as e:
-        st.warning(f"{session_type} session **could not be loaded**. Reason: {e}")
+        diagnostics.warn(f"{session_type} session **could not be loaded**. Reason: {e}")
+        return None
+
+# Same as load_session, but reuses sessions already loaded by any user of this process
+@timing.timed()
+def load_session_cached(mode, year, grand_prix, session_type, requirements=None):
+    if mode != "Grand Prix" or not all([year, grand_prix, session_type]):
+        return None
+
+    key = (int(year), grand_prix, session_type)
+    return session_cache.SESSIONS.get_or_load(
+        key,
+        lambda: load_session(mode, year, grand_prix, session_type, requirements),
+        upgrade=lambda session: ensure_session_data(session, requirements or ALL_DATA)
+    )
+
+'''------------------------------------------------------------------------------------'''
+
+'''SHARED TELEMETRY'''
+
+# Fastest lap of a driver with its merged telemetry and sector distances, or None if the driver
+# has no timed lap. get_telemetry() is one of the slowest calls in the app: the telemetry store
+# calls this once per driver and keeps the resampled lap, the plots read the store
+def fastest_lap_telemetry(session, driver):
+    lapdata = session.laps.pick_drivers(driver).pick_fastest()
+    if lapdata is None:
         return None
 
+    with timing.span("get_telemetry"):
+        telemetry = lapdata.get_telemetry().add_distance()
+
+    # Distance at which the driver crossed the end of sector 1 and 2
+    sector1_dist = telemetry[telemetry["Time"] <= lapdata["Sector1Time"]].iloc[-1]["Distance"]
+    sector2_dist = telemetry[telemetry["Time"] <= lapdata["Sector1Time"] + lapdata["Sector2Time"]].iloc[-1]["Distance"]
+
+    return {
+        "lap": lapdata,
+        "telemetry": telemetry,
+        "sector1_distance": sector1_dist,
+        "sector2_distance": sector2_dist,
+    }
+
+# Linear interpolation of several channels sampled at the same distances onto a new grid,
+# all channels in one pass. distance must be increasing, channels has one row per channel
+def resample_channels(distance, channels, grid):
+    distance = np.asarray(distance, dtype=float)
+    channels = np.atleast_2d(np.asarray(channels, dtype=float))
+    grid = np.asarray(grid, dtype=float)
+
+    # Neighbouring samples of every grid point and the weight of the right one
+    idx = np.clip(np.searchsorted(distance, grid, side="right") - 1, 0, len(distance) - 2)
+    d0 = distance[idx]
+    span = distance[idx + 1] - d0
+    weight = np.divide(grid - d0, span, out=np.zeros_like(grid), where=span > 0)
+    weight = np.clip(weight, 0, 1)
+
+    return channels[:, idx] * (1 - weight) + channels[:, idx + 1] * weight
+
+# Time gaps between laps on the same distance grid in one broadcast, times has one row per driver.
+# With a reference row: every lap minus the reference, shape (drivers, points).
+# Without: every pair, gaps[i, j] = times[i] - times[j], shape (drivers, drivers, points)
+def time_deltas(times, reference=None):
+    times = np.asarray(times)
+    if reference is None:
+        return times[:, None, :] - times[None, :, :]
+    return times - times[reference]
+
+# Mean of every row of values over n_subsectors equal slices of its columns, shape (rows, n_subsectors),
+# and the subsector of every column. There are never more subsectors than columns
+def subsector_means(values, n_subsectors):
+    values = np.atleast_2d(values)
+    points = values.shape[1]
+    n_subsectors = max(1, min(int(n_subsectors), points))
+
+    subsector = np.arange(points) * n_subsectors // points
+    starts = np.searchsorted(subsector, np.arange(n_subsectors))
+    counts = np.diff(np.append(starts, points))
+    return np.add.reduceat(values, starts, axis=1) / counts, subsector
+
+'''------------------------------------------------------------------------------------'''
+
+'''SESSION TABLES'''
+
+# Bump when the summary tables change, so old Parquet copies are not read anymore
+SUMMARY_VERSION = 2
+
+# Tables of summary_tables(), a stored copy missing any of them is computed again
+SUMMARY_TABLES = ("drivers", "teams", "quick_laps", "driver_teams", "results")
+
+_summary_lock = threading.Lock()
+
+# Compact tables every ranking plot reads, with lap times as float seconds:
+#   drivers       fastest lap per driver (Driver, Team, LapTime, Delta), fastest first
+#   teams         fastest lap per team (Team, Driver, LapTime, Delta), fastest first
+#   quick_laps    laps kept by pick_quicklaps() (Driver, Team, LapTime)
+#   driver_teams  team of every driver (Driver, Team)
+#   results       classification (Position, Abbreviation, TeamName, Time, Status)
+def summary_tables(session):
+    laps = session.laps
+    timed = pd.DataFrame({
+        "Driver": laps["Driver"],
+        "Team": laps["Team"],
+        "LapTime": laps["LapTime"].dt.total_seconds(),
+    })
+    valid = timed.dropna(subset=["LapTime"])
+
+    drivers = valid.loc[valid.groupby("Driver")["LapTime"].idxmin()].sort_values("LapTime", kind="stable")
+    drivers["Delta"] = drivers["LapTime"] - drivers["LapTime"].min()
+
+    teams = valid.loc[valid.groupby("Team")["LapTime"].idxmin(), ["Team", "Driver", "LapTime"]].sort_values("LapTime", kind="stable")
+    teams["Delta"] = teams["LapTime"] - teams["LapTime"].min()
+
+    quick_laps = timed.loc[laps.pick_quicklaps().index]
+
+    driver_teams = valid.groupby("Driver")["Team"].first().reset_index()
+
+    results = session.results
+    results = pd.DataFrame({
+        "Position": results["Position"].astype(float),
+        "Abbreviation": results["Abbreviation"],
+        "TeamName": results["TeamName"],
+        "Time": pd.to_timedelta(results["Time"]).dt.total_seconds(),
+        "Status": results["Status"],
+    })
+
+    tables = {
+        "drivers": drivers,
+        "teams": teams,
+        "quick_laps": quick_laps,
+        "driver_teams": driver_teams,
+        "results": results,
+    }
+    return {name: table.reset_index(drop=True) for name, table in tables.items()}
+
+# Summary tables of a session, computed once and shared by every plot.
+# They are stored as Parquet next to the cached session, so later loads skip the computation
+def session_summary(session):
+    with _summary_lock:
+        summary = session.__dict__.get("_summary")
+        if summary is not None:
+            return summary
+
+        summary = session_cache.load_summary(session, SUMMARY_VERSION, SUMMARY_TABLES)
+        if summary is None:
+            summary = summary_tables(session)
+            session_cache.save_summary(session, SUMMARY_VERSION, summary)
+
+        session._summary = summary
+        return summary
+
+# Top speed trap and best lap of every driver, in one pass over the laps.
+# Columns: Driver, Team, MaxSpeedST (km/h), BestLapTime and Delta to the best driver (s).
+# BestLapTime is NaN for drivers without a personal best lap
+def max_speed_table(session):
+    laps = session.laps
+
+    # Same lap pick_fastest() returns: the quickest one marked as personal best
+    personal_best = laps["LapTime"].where(laps["IsPersonalBest"] == True)
+
+    table = pd.DataFrame({
+        "Driver": laps["Driver"],
+        "Team": laps["Team"],
+        "SpeedST": laps["SpeedST"],
+        "LapTime": personal_best.dt.total_seconds(),
+    }).groupby("Driver", sort=False).agg(
+        Team=("Team", "first"),
+        MaxSpeedST=("SpeedST", "max"),
+        BestLapTime=("LapTime", "min"),
+    ).reset_index()
+
+    table["Delta"] = table["BestLapTime"] - table["BestLapTime"].min()
+    return table
+
+# Encode a table as CSV or JSON (one record per row)
+def table_bytes(table, file_format="csv"):
+    if file_format == "json":
+        return table.to_json(orient="records", indent=2).encode()
+    return table.to_csv(index=False).encode()
+
+'''------------------------------------------------------------------------------------'''
+
+'''RACE PACE'''
+
+# Fuel model of the pace engine: every kg of fuel costs FUEL_EFFECT_S_PER_KG per lap
+# and FUEL_PER_LAP_KG are burned every lap, so lap times are corrected to an empty tank
+FUEL_EFFECT_S_PER_KG = float(os.environ.get("F1_FUEL_EFFECT_S_PER_KG", "0.03"))
+FUEL_PER_LAP_KG = float(os.environ.get("F1_FUEL_PER_LAP_KG", "1.7"))
+
+# Laps slower than this factor of the median green flag lap of their driver don't count
+# for the pace (traffic, mistakes, safety car endings)
+PACE_OUTLIER_FACTOR = 1.07
+
+# Tyre age at which the pace of every stint is compared, from its degradation fit
+PACE_TYRE_AGE = 1
+
+
+# Plot inputs set by environment variables rather than by the plot arguments, part of the figure cache key
+def plot_settings():
+    import telemetry_store
+
+    return {
+        "fuel_effect_s_per_kg": FUEL_EFFECT_S_PER_KG,
+        "fuel_per_lap_kg": FUEL_PER_LAP_KG,
+        "telemetry_grid_step": telemetry_store.GRID_STEP,
+    }
+
+# Tyre compound colors
+COMPOUND_COLORS = {
+    "SOFT": "#DA291C",
+    "MEDIUM": "#FFD12E",
+    "HARD": "#F0F0EC",
+    "INTERMEDIATE": "#43B02A",
+    "WET": "#0067AD",
+}
+
+_pace_lock = threading.Lock()
+
+# Stint of every lap, from the Stint column where fastf1 has it, otherwise counted
+# from the pit exits of the driver (a lap with PitOutTime after the first lap starts a new stint)
+def detect_stints(laps):
+    pit_out = (laps["PitOutTime"].notna() & (laps["LapNumber"] > 1)).astype(int)
+    counted = pit_out.groupby(laps["Driver"]).cumsum() + 1
+    return laps["Stint"].fillna(counted) if "Stint" in laps else counted
+
+# Degradation fit of every group at once: least squares of y = intercept + slope * x, with the sums
+# of each group gathered by np.bincount. Groups with less than two distinct x get a NaN slope
+def grouped_linear_fit(group, x, y, n_groups):
+    n = np.bincount(group, minlength=n_groups).astype(float)
+    sx = np.bincount(group, weights=x, minlength=n_groups)
+    sy = np.bincount(group, weights=y, minlength=n_groups)
+    sxx = np.bincount(group, weights=x * x, minlength=n_groups)
+    sxy = np.bincount(group, weights=x * y, minlength=n_groups)
+
+    denominator = n * sxx - sx * sx
+    valid = denominator > 1e-9
+    slope = np.divide(n * sxy - sx * sy, denominator, out=np.full(n_groups, np.nan), where=valid)
+    intercept = np.divide(sy - slope * sx, n, out=np.full(n_groups, np.nan), where=valid)
+    return intercept, slope, n
+
+# Every lap of a Race or Sprint with its pace, in seconds: LapTime, FuelCorrected (empty tank),
+# Normalized (fuel corrected and brought back to PACE_TYRE_AGE with the degradation of its stint),
+# and the Degradation and StintPace fitted for its stint. Valid marks the green flag laps out of the pits used for the fits
+def pace_laps(session):
+    laps = session.laps
+    table = pd.DataFrame({
+        "Driver": laps["Driver"].to_numpy(),
+        "Team": laps["Team"].to_numpy(),
+        "LapNumber": laps["LapNumber"].to_numpy(dtype=float),
+        "Stint": detect_stints(laps).to_numpy(dtype=float),
+        "Compound": laps["Compound"].fillna("UNKNOWN").to_numpy(),
+        "TyreLife": laps["TyreLife"].to_numpy(dtype=float),
+        "LapTime": laps["LapTime"].dt.total_seconds().to_numpy(),
+    })
+
+    # Fuel left at the start of every lap, burned evenly until the end of the race distance
+    laps_to_go = table["LapNumber"].max() - table["LapNumber"]
+    table["FuelCorrected"] = table["LapTime"] - laps_to_go * FUEL_PER_LAP_KG * FUEL_EFFECT_S_PER_KG
+
+    green = laps["TrackStatus"].fillna("1").astype(str).str.fullmatch("1+").to_numpy() if "TrackStatus" in laps else True
+    deleted = laps["Deleted"].fillna(False).to_numpy(dtype=bool) if "Deleted" in laps else False
+    valid = (table["LapTime"].notna() & laps["PitInTime"].isna().to_numpy() & laps["PitOutTime"].isna().to_numpy()
+             & (table["LapNumber"] > 1) & green & ~deleted)
+    median = table["FuelCorrected"].where(valid).groupby(table["Driver"]).transform("median")
+    table["Valid"] = valid & (table["FuelCorrected"] <= median * PACE_OUTLIER_FACTOR)
+
+    # Degradation slope of every stint of every driver in one least squares pass
+    stint_id = table.groupby(["Driver", "Stint"], sort=False).ngroup().to_numpy()
+    n_stints = stint_id.max() + 1 if len(stint_id) else 0
+    fit = table["Valid"].to_numpy()
+    intercept, slope, _ = grouped_linear_fit(stint_id[fit], table["TyreLife"].to_numpy()[fit],
+                                             table["FuelCorrected"].to_numpy()[fit], n_stints)
+    table["Degradation"] = slope[stint_id]
+    table["Normalized"] = table["FuelCorrected"] - np.nan_to_num(slope[stint_id]) * (table["TyreLife"] - PACE_TYRE_AGE)
+    table["StintPace"] = intercept[stint_id] + slope[stint_id] * PACE_TYRE_AGE
+    return table
+
+# One row per stint of the laps of pace_laps()
+def _stint_table(laps):
+    valid = laps[laps["Valid"]]
+
+    stints = laps.groupby(["Driver", "Stint"], sort=False).agg(
+        Team=("Team", "first"),
+        Compound=("Compound", "first"),
+        FirstLap=("LapNumber", "min"),
+        LastLap=("LapNumber", "max"),
+        Laps=("LapNumber", "size"),
+        TyreLifeStart=("TyreLife", "min"),
+        Degradation=("Degradation", "first"),
+        Pace=("StintPace", "first"),
+    )
+    pace = valid.groupby(["Driver", "Stint"], sort=False).agg(
+        PaceLaps=("LapNumber", "size"),
+        MeanLapTime=("LapTime", "mean"),
+        FuelCorrected=("FuelCorrected", "mean"),
+    )
+    table = stints.join(pace, how="left").reset_index()
+    table["PaceLaps"] = table["PaceLaps"].fillna(0).astype(int)
+
+    columns = ["Driver", "Team", "Stint", "Compound", "FirstLap", "LastLap", "Laps", "PaceLaps",
+               "TyreLifeStart", "MeanLapTime", "FuelCorrected", "Degradation", "Pace"]
+    return table[columns].sort_values(["Driver", "Stint"], kind="stable").reset_index(drop=True)
+
+# Pace tables of a session, computed once and shared by the plot and the export:
+# {"laps": pace_laps(), "stints": one row per stint}
+def race_pace(session):
+    with _pace_lock:
+        pace = session.__dict__.get("_race_pace")
+        if pace is None:
+            with timing.span("race_pace"):
+                laps = pace_laps(session)
+                pace = {"laps": laps, "stints": _stint_table(laps)}
+            session._race_pace = pace
+        return pace
+
+# One row per stint: Driver, Team, Stint, Compound, FirstLap, LastLap, Laps, PaceLaps (laps of the fit),
+# TyreLifeStart, MeanLapTime, FuelCorrected (mean), Degradation (s per lap of tyre age)
+# and Pace (fuel corrected at PACE_TYRE_AGE), times in seconds
+def stint_pace_table(session):
+    return race_pace(session)["stints"]
+
 '''------------------------------------------------------------------------------------'''
 
 '''RACE PLOTS'''
 
 # Plot 0: Rankings FP
-def plot_free_practice_ranking(session):
-    plt.style.use("dark_background") 
+@requires(LAPS)
+@dark_style
+def plot_free_practice_ranking(session, profile=None):
 
-    # Filter out in-laps or laps without a valid time
-    valid_laps = session.laps.dropna(subset=["LapTime"])
-    
-    # Pick fastest laps by driver
-    fastest_laps = valid_laps.loc[valid_laps.groupby("Driver")["LapTime"].idxmin()]
-    fastest_laps = fastest_laps.sort_values("LapTime")
+    # Fastest lap by driver, fastest first
+    fastest_laps = session_summary(session)["drivers"]
 
     drivers = fastest_laps["Driver"]
     teams = fastest_laps["Team"]
-    delta_time = (fastest_laps["LapTime"] - fastest_laps["LapTime"].min()).dt.total_seconds()
+    delta_time = fastest_laps["Delta"]
     
     # Get best lap time and driver
-    best_lap_time = fastest_laps["LapTime"].min()
-    best_driver = fastest_laps.loc[fastest_laps["LapTime"].idxmin(), "Driver"]
+    best_driver = fastest_laps["Driver"].iloc[0]
 
     # Format time to m:ss.sss
-    total_seconds = best_lap_time.total_seconds()
+    total_seconds = fastest_laps["LapTime"].iloc[0]
     formatted_time = f"{int(total_seconds // 60)}:{total_seconds % 60:06.3f}"  
 
     # Create figure and axis
-    fig, ax = plt.subplots(figsize=(16, 9), dpi=1000)
+    fig = figures.new_figure(figsize=(16, 9), dpi=profile_dpi(profile))
+    ax = fig.subplots()
 
     # Use team colors for the bars
     colors = [TEAM_COLORS.get(team, "gray") for team in teams]
@@ -145,41 +561,42 @@ def plot_free_practice_ranking(session):
     # Pad the right x-axis limit so the text doesn't get clipped
     ax.set_xlim(right=max(delta_time) * 1.1)
 
-    plt.suptitle(
+    fig.suptitle(
         f"Free Practice Session Ranking\n"
         f"{session.event['EventName']} {session.event.year} {session.name}\n"
         f"Fastest Lap: {best_driver} {formatted_time}\n",
         fontsize=14
     )
 
-    plt.tight_layout()
+    fig.tight_layout()
 
     return fig
 
 # Plot: Race Fastest Laps Ranking (Drivers) with Delta Times
-def plot_race_ranking_table(session):
-    plt.style.use("dark_background") 
+@requires(LAPS)
+@dark_style
+def plot_race_ranking_table(session, profile=None):
+
+    summary = session_summary(session)
 
     # 1) Get the overall fastest lap for the title
-    valid_laps = session.laps.dropna(subset=["LapTime"])
-    best_lap = valid_laps.loc[valid_laps["LapTime"].idxmin()]
+    best_lap = summary["drivers"].iloc[0]
     best_driver = best_lap["Driver"]
-    best_lap_time = best_lap["LapTime"]
     
-    total_seconds = best_lap_time.total_seconds()
+    total_seconds = best_lap["LapTime"]
     formatted_time = f"{int(total_seconds // 60)}:{total_seconds % 60:06.3f}"  
 
     # 2) Get the race results
-    results = session.results.sort_values("Position")
+    results = summary["results"].sort_values("Position")
     
     # Get winner explicitly
     winner = results.loc[results["Position"] == 1].iloc[0]
-    winner_time = winner["Time"]
-    winner_time_sec = winner_time.total_seconds() if pd.notna(winner_time) else 0
+    winner_time_sec = winner["Time"] if pd.notna(winner["Time"]) else 0
     
     # Extract driver to team mapping directly from laps data. 
     # This guarantees we use the exact team names your TEAM_COLORS dictionary expects.
-    driver_to_team = valid_laps.groupby("Driver")["Team"].first().to_dict()
+    driver_teams = summary["driver_teams"]
+    driver_to_team = dict(zip(driver_teams["Driver"], driver_teams["Team"]))
 
     # 3) Prepare data for the table
     columns = ["Position", "Driver", "Gap / Status"]
@@ -193,7 +610,7 @@ def plot_race_ranking_table(session):
         
         # Determine gap or status
         if pd.notna(row["Time"]) and winner_time_sec > 0:
-            row_time_sec = row["Time"].total_seconds()
+            row_time_sec = row["Time"]
             
             if row["Position"] == 1:
                 status = "Winner"
@@ -214,7 +631,8 @@ def plot_race_ranking_table(session):
         cell_text.append([pos, driver, status])
 
     # 4) Create figure and axis
-    fig, ax = plt.subplots(figsize=(8, 10), dpi=1000)
+    fig = figures.new_figure(figsize=(8, 10), dpi=profile_dpi(profile))
+    ax = fig.subplots()
     ax.axis("off") 
 
     # 5) Create the table
@@ -255,7 +673,7 @@ def plot_race_ranking_table(session):
                 cell.get_text().set_color("white")
 
     # Add the title with Fastest Lap info
-    plt.suptitle(
+    fig.suptitle(
         f"Final Race Classification\n"
         f"{session.event['EventName']} {session.event.year} {session.name}\n"
         f"Fastest Lap: {best_driver} {formatted_time}\n",
@@ -263,15 +681,17 @@ def plot_race_ranking_table(session):
         y=0.95
     )
 
-    plt.tight_layout()
+    fig.tight_layout()
 
     return fig
 
 # Plot 1: Stint comparison between drivers
-def plot_stint_comparison(session, drivers, team_colors):
+@requires(LAPS)
+@dark_style
+def plot_stint_comparison(session, drivers, team_colors, profile=None):
 
-    plt.style.use("dark_background")
-    fig, ax = plt.subplots(figsize=(16, 9), dpi=1000)
+    fig = figures.new_figure(figsize=(16, 9), dpi=profile_dpi(profile))
+    ax = fig.subplots()
     
     driver_positions = {}
     pit_lap_counts = defaultdict(int)  # Track how many pit stops happened on each lap
@@ -281,14 +701,14 @@ def plot_stint_comparison(session, drivers, team_colors):
 
         # Check if driver attended the session
         if laps is None or laps.empty:
-            st.warning(f"**{driver}** did not participate in the {session.name}.")
+            diagnostics.warn(f"**{driver}** did not participate in the {session.name}.")
             continue
 
         team = laps.iloc[0]["Team"]  
         color = team_colors.get(team, "white")  
         final_position = laps.iloc[-1]["Position"]  
         if pd.isna(final_position):
-            st.warning(f"**{driver}** did not finish the {session.name}.")
+            diagnostics.warn(f"**{driver}** did not finish the {session.name}.")
             continue
 
         pit_stops = laps["PitInTime"].count()
@@ -325,7 +745,7 @@ def plot_stint_comparison(session, drivers, team_colors):
 
     # Warning safety car through pit lane
     if pit_stops > 3:
-        st.warning('A Safety Car through the pit lane could be present, be careful about pit stop count.')
+        diagnostics.warn('A Safety Car through the pit lane could be present, be careful about pit stop count.')
 
     # Plotting
     driver_info = " vs ".join([f"{driver} (P{int(pos)})" for driver, pos in driver_positions.items()])
@@ -341,13 +761,13 @@ def plot_stint_comparison(session, drivers, team_colors):
     return fig
 
 # Plot 2: Lap time distribution
-def plot_lap_time_distribution(session, team_colors):
-    plt.style.use("dark_background")
+@requires(LAPS)
+@dark_style
+def plot_lap_time_distribution(session, team_colors, profile=None):
+    import seaborn as sns
     
     # Select and order laps
-    laps = session.laps.pick_quicklaps()
-    transformed_laps = laps.copy()
-    transformed_laps.loc[:, "LapTime (s)"] = laps["LapTime"].dt.total_seconds()
+    transformed_laps = session_summary(session)["quick_laps"].rename(columns={"LapTime": "LapTime (s)"})
     team_order = (
         transformed_laps[["Team", "LapTime (s)"]]
         .groupby("Team")
@@ -355,12 +775,12 @@ def plot_lap_time_distribution(session, team_colors):
         .sort_values()
         .index
     )
-    print(team_order)
 
     team_palette = {team: team_colors.get(team, "#888888") for team in team_order}
 
     # Create figure and axis
-    fig, ax = plt.subplots(figsize=(16, 9), dpi=1000)
+    fig = figures.new_figure(figsize=(16, 9), dpi=profile_dpi(profile))
+    ax = fig.subplots()
     
     # Plotting
     sns.boxplot(
@@ -382,40 +802,101 @@ def plot_lap_time_distribution(session, team_colors):
                  f"Lap Time Distribution", fontsize=14)
     ax.grid(True, linestyle="--", alpha=0.5)
     ax.set(xlabel=None)
-    plt.tight_layout()
+    fig.tight_layout()
     
     return fig 
 
 
+# Plot 3: Race pace, fuel corrected lap times with the degradation of every stint
+@requires(LAPS)
+@dark_style
+def plot_race_pace(session, drivers, team_colors, profile=None):
+    pace = race_pace(session)
+    laps, stints = pace["laps"], pace["stints"]
+
+    present = []
+    for driver in drivers:
+        if not (laps["Driver"] == driver).any():
+            diagnostics.warn(f"**{driver}** did not participate in the {session.name}.")
+        elif not stints.loc[stints["Driver"] == driver, "PaceLaps"].any():
+            diagnostics.warn(f"No green flag laps for **{driver}** in the {session.name}, no pace to show.")
+        else:
+            present.append(driver)
+    if not present:
+        return None
+
+    laps = laps[laps["Driver"].isin(present)]
+    stints = stints[stints["Driver"].isin(present)]
+    teams = laps.groupby("Driver")["Team"].first()
+    styles = dict(zip(present, driver_styles([teams[driver] for driver in present], team_colors)))
+    colors = {driver: color for driver, (color, _) in styles.items()}
+
+    fig = figures.new_figure(figsize=(16, 9), dpi=profile_dpi(profile))
+    ax_laps, ax_stints = fig.subplots(2, 1, gridspec_kw={"height_ratios": [3, 2]})
+
+    # Fuel corrected laps and the fitted degradation line of every stint
+    valid = laps[laps["Valid"]]
+    fitted = laps["StintPace"] + laps["Degradation"] * (laps["TyreLife"] - PACE_TYRE_AGE)
+    for driver in present:
+        driver_laps = valid[valid["Driver"] == driver]
+        ax_laps.scatter(driver_laps["LapNumber"], driver_laps["FuelCorrected"], color=colors[driver], s=14, alpha=0.7, label=driver)
+        for _, stint_laps in laps[laps["Driver"] == driver].groupby("Stint"):
+            ax_laps.plot(stint_laps["LapNumber"], fitted[stint_laps.index], color=colors[driver], linestyle=styles[driver][1], linewidth=2)
+
+    ax_laps.set_xlabel("Lap Number")
+    ax_laps.set_ylabel("Fuel Corrected Lap Time (s)")
+    ax_laps.xaxis.set_major_locator(MaxNLocator(integer=True))
+    ax_laps.grid(True, linestyle="--", alpha=0.5)
+    ax_laps.legend()
+
+    # Pace of every stint at the same tyre age, in the color of its compound
+    stints = stints.dropna(subset=["Pace"]).iloc[::-1]
+    labels = [f"{row.Driver} S{int(row.Stint)} {row.Compound.title()}" for row in stints.itertuples()]
+    positions = np.arange(len(stints))
+    ax_stints.barh(positions, stints["Pace"], color=[COMPOUND_COLORS.get(compound, "gray") for compound in stints["Compound"]],
+                   edgecolor=[colors[driver] for driver in stints["Driver"]], linewidth=2)
+    for position, row in zip(positions, stints.itertuples()):
+        ax_stints.text(row.Pace, position, f"  {row.Pace:.3f}s  {row.Degradation:+.3f} s/lap  ({row.PaceLaps} laps)",
+                       va="center", ha="left", fontsize=9, color="white")
+
+    ax_stints.set_yticks(positions, labels)
+    if len(stints):
+        ax_stints.set_xlim(stints["Pace"].min() - 1, stints["Pace"].max() + 1.5)
+    ax_stints.set_xlabel(f"Stint Pace, fuel corrected at tyre age {PACE_TYRE_AGE} (s)")
+    ax_stints.grid(True, axis="x", linestyle="--", alpha=0.5)
+
+    fig.suptitle(f"{session.event['EventName']} {session.event.year} {session.name}\n"
+                 f"Race Pace: {' vs '.join(present)}", fontsize=14)
+    fig.tight_layout()
+
+    return fig
+
 '''--------------------------------------------------------------------'''
 
 '''QUALIFYING PLOTS'''
 
 # Plot 0: Session Ranking (Drivers) with Delta Times
-def plot_session_ranking(session):
-    plt.style.use("dark_background") 
+@requires(LAPS)
+@dark_style
+def plot_session_ranking(session, profile=None):
 
-    # Filter out in-laps or laps without a valid time
-    valid_laps = session.laps.dropna(subset=["LapTime"])
-    
-    # Pick fastest laps by driver
-    fastest_laps = valid_laps.loc[valid_laps.groupby("Driver")["LapTime"].idxmin()]
-    fastest_laps = fastest_laps.sort_values("LapTime")
+    # Fastest lap by driver, fastest first
+    fastest_laps = session_summary(session)["drivers"]
 
     drivers = fastest_laps["Driver"]
     teams = fastest_laps["Team"]
-    delta_time = (fastest_laps["LapTime"] - fastest_laps["LapTime"].min()).dt.total_seconds()
+    delta_time = fastest_laps["Delta"]
     
     # Get best lap time and driver
-    best_lap_time = fastest_laps["LapTime"].min()
-    best_driver = fastest_laps.loc[fastest_laps["LapTime"].idxmin(), "Driver"]
+    best_driver = fastest_laps["Driver"].iloc[0]
 
     # Format time to m:ss.sss
-    total_seconds = best_lap_time.total_seconds()
+    total_seconds = fastest_laps["LapTime"].iloc[0]
     formatted_time = f"{int(total_seconds // 60)}:{total_seconds % 60:06.3f}"  
 
     # Create figure and axis
-    fig, ax = plt.subplots(figsize=(16, 9), dpi=1000)
+    fig = figures.new_figure(figsize=(16, 9), dpi=profile_dpi(profile))
+    ax = fig.subplots()
 
     # Use team colors for the bars
     colors = [TEAM_COLORS.get(team, "gray") for team in teams]
@@ -448,38 +929,38 @@ def plot_session_ranking(session):
     # Pad the right x-axis limit so the text doesn't get clipped
     ax.set_xlim(right=max(delta_time) * 1.1)
 
-    plt.suptitle(
+    fig.suptitle(
         f"Qualifying Session Ranking\n"
         f"{session.event['EventName']} {session.event.year} {session.name}\n"
         f"Pole Lap: {best_driver} {formatted_time}\n",
         fontsize=14
     )
 
-    plt.tight_layout()
+    fig.tight_layout()
 
     return fig
 
 # Plot 1: Best Lap per Team in Qualifying
-def plot_best_laps(session):
-    plt.style.use("dark_background") 
+@requires(LAPS)
+@dark_style
+def plot_best_laps(session, profile=None):
 
-    # Pick fastest laps by team
-    fastest_laps = session.laps.loc[session.laps.groupby("Team")["LapTime"].idxmin()]
-    fastest_laps = fastest_laps.sort_values("LapTime")
+    # Fastest lap by team, fastest first
+    fastest_laps = session_summary(session)["teams"]
 
     teams = fastest_laps["Team"]
-    delta_time = (fastest_laps["LapTime"] - fastest_laps["LapTime"].min()).dt.total_seconds()
+    delta_time = fastest_laps["Delta"]
     
     # Get best lap time and driver
-    best_lap_time = fastest_laps["LapTime"].min()
-    best_driver = fastest_laps.loc[fastest_laps["LapTime"].idxmin(), "Driver"]
+    best_driver = fastest_laps["Driver"].iloc[0]
 
     # Format time to m:ss.sss
-    total_seconds = best_lap_time.total_seconds()
+    total_seconds = fastest_laps["LapTime"].iloc[0]
     formatted_time = f"{int(total_seconds // 60)}:{total_seconds % 60:06.3f}"  
 
     # Create figure and axis
-    fig, ax = plt.subplots(figsize=(16, 9), dpi=1000)
+    fig = figures.new_figure(figsize=(16, 9), dpi=profile_dpi(profile))
+    ax = fig.subplots()
 
     # Use team colors
     colors = [TEAM_COLORS.get(team, "gray") for team in teams]
@@ -491,106 +972,85 @@ def plot_best_laps(session):
     ax.invert_yaxis()
     ax.grid(True, linestyle="--", alpha=0.5)
 
-    plt.suptitle(
+    fig.suptitle(
         f"Best Lap Time Per Team\n"
         f"{session.event['EventName']} {session.event.year} {session.name}\n"
         f"Fastest Lap: {best_driver} {formatted_time}\n",
         fontsize=14
     )
 
-    plt.tight_layout()
+    fig.tight_layout()
 
     return fig
 
 # Plot 2: Lap Time Comparison
-def plot_lap_comparison(session, driver1, driver2):
-    plt.style.use("dark_background")
+@requires(LAPS, TELEMETRY)
+@dark_style
+def plot_lap_comparison(session, driver1, driver2, profile=None):
+    import telemetry_store
 
-    # Get fastest lap telemetry for both drivers
-    lapdata1 = session.laps.pick_drivers(driver1).pick_fastest()
-    lapdata2 = session.laps.pick_drivers(driver2).pick_fastest()
+    # Fastest laps of both drivers, resampled on the distance grid of the circuit
+    store = telemetry_store.telemetry_store(session, [driver1, driver2])
+    info1 = store.driver_info(driver1)
+    info2 = store.driver_info(driver2)
 
     # Be sure drivers participated to the session
-    if lapdata1 is None:
-        st.warning(f"No laps completed for **{driver1}** in {session.name}, probably crash or substituted by a rookie. Cannot display lap comparison with {driver2}.")
+    if info1 is None:
+        diagnostics.warn(f"No laps completed for **{driver1}** in {session.name}, probably crash or substituted by a rookie. Cannot display lap comparison with {driver2}.")
         return None
-    if lapdata2 is None:
-        st.warning(f"No laps completed for **{driver2}** in {session.name}, probably crash or substituted by a rookie. Cannot display lap comparison with {driver1}.")
+    if info2 is None:
+        diagnostics.warn(f"No laps completed for **{driver2}** in {session.name}, probably crash or substituted by a rookie. Cannot display lap comparison with {driver1}.")
         return None
     else:
-        lap1 = lapdata1.get_telemetry().add_distance()
-        lap2 = lapdata2.get_telemetry().add_distance()
+        color1 = TEAM_COLORS.get(info1["Team"], "gray")
+        color2 = TEAM_COLORS.get(info2["Team"], "gray")
 
-        driver1_team = lapdata1["Team"]
-        driver2_team = lapdata2["Team"]
-        
-        color1 = TEAM_COLORS.get(driver1_team, "gray")
-        color2 = TEAM_COLORS.get(driver2_team, "gray")
-
-        # Format laptimes individually
-        def format_time(timedelta):
-            total_seconds = timedelta.total_seconds()
-            minutes = int(total_seconds // 60)
-            seconds = int(total_seconds % 60)
-            millis = int((total_seconds - minutes * 60 - seconds) * 1000)
-            return f"{minutes}:{seconds:02}.{millis:03}"
-
-        lap_time1 = lapdata1["LapTime"]
-        lap_time2 = lapdata2["LapTime"]
+        formatted_time1 = _format_lap_time(info1["LapTime"])
+        formatted_time2 = _format_lap_time(info2["LapTime"])
 
-        formatted_time1 = format_time(lap_time1)
-        formatted_time2 = format_time(lap_time2)
+        # Both laps share the grid, each channel is one row per driver
+        drivers = [driver1, driver2]
+        grid = store.grid
+        speed = store.channel("Speed", drivers)
+        throttle = store.channel("Throttle", drivers)
+        points1, points2 = info1["Points"], info2["Points"]
 
         # Create figure and axes
-        fig, axs = plt.subplots(3, 1, figsize=(16, 9), dpi=1000)
+        fig = figures.new_figure(figsize=(16, 9), dpi=profile_dpi(profile))
+        axs = fig.subplots(3, 1)
 
         # Speed comparison
-        axs[0].plot(lap1["Distance"], lap1["Speed"], label=driver1, color=color1)
-        axs[0].plot(lap2["Distance"], lap2["Speed"], label=driver2, color=color2)
+        axs[0].plot(grid[:points1], speed[0, :points1], label=driver1, color=color1)
+        axs[0].plot(grid[:points2], speed[1, :points2], label=driver2, color=color2)
         axs[0].set_ylabel("Speed (km/h)")
         axs[0].legend()
         axs[0].grid(True, linestyle="--", alpha=0.5)
 
         # Throttle comparison
-        axs[1].plot(lap1["Distance"], lap1["Throttle"], label=driver1, color=color1)
-        axs[1].plot(lap2["Distance"], lap2["Throttle"], label=driver2, color=color2)
+        axs[1].plot(grid[:points1], throttle[0, :points1], label=driver1, color=color1)
+        axs[1].plot(grid[:points2], throttle[1, :points2], label=driver2, color=color2)
         axs[1].set_ylabel("Throttle (%)")
         axs[1].grid(True, linestyle="--", alpha=0.5)
 
-        # Convert Timedelta to total seconds
-        lap1_time_seconds = lap1["Time"].dt.total_seconds()
-        lap2_time_seconds = lap2["Time"].dt.total_seconds()
-
-        lap1_time_seconds -= lap1_time_seconds.iloc[0]
-        lap2_time_seconds -= lap2_time_seconds.iloc[0]
-
-        # Convert distances into percentage of lap completion
-        lap1_percentage = lap1["Distance"] / lap1["Distance"].max()
-        lap2_percentage = lap2["Distance"] / lap2["Distance"].max()
-
-        common_progress = np.linspace(0, 1, num=500)
-
-        lap1_time_interp = interp1d(lap1_percentage, lap1_time_seconds, kind="linear", fill_value="extrapolate")
-        lap2_time_interp = interp1d(lap2_percentage, lap2_time_seconds, kind="linear", fill_value="extrapolate")
-
-        lap1_time_common = lap1_time_interp(common_progress)
-        lap2_time_common = lap2_time_interp(common_progress)
-
-        time_gap = lap1_time_common - lap2_time_common
+        # Gap at every point of the track: elapsed times at the same distance subtracted
+        points = store.common_points(drivers)
+        lap_time = store.channel("Time", drivers, points)
+        time_gap = time_deltas(lap_time, 1)[0]
+        lap_percentage = grid[:points] / grid[points - 1] * 100
 
         # Delta time comparison
-        axs[2].plot(common_progress * 100, time_gap, color="white")
+        axs[2].plot(lap_percentage, time_gap, color="white")
         axs[2].set_ylabel(f"{driver1} vs {driver2}")
         axs[2].axhline(0, color="gray", linestyle="--", alpha=0.7)
         axs[2].grid(True, linestyle="--", alpha=0.5)
         axs[2].set_xlabel("Distance (%)")
 
         # Sector markers
-        sector1_dist = lap1[lap1["Time"] <= lapdata1["Sector1Time"]].iloc[-1]["Distance"]
-        sector2_dist = lap1[lap1["Time"] <= lapdata1["Sector1Time"] + lapdata1["Sector2Time"]].iloc[-1]["Distance"]
+        sector1_dist = info1["Sector1Distance"]
+        sector2_dist = info1["Sector2Distance"]
 
-        sector1_pct = sector1_dist / lap1["Distance"].max() * 100
-        sector2_pct = sector2_dist / lap1["Distance"].max() * 100
+        sector1_pct = sector1_dist / grid[points - 1] * 100
+        sector2_pct = sector2_dist / grid[points - 1] * 100
 
         for i, ax in enumerate(axs):
             if i < 2:
@@ -621,57 +1081,44 @@ def plot_lap_comparison(session, driver1, driver2):
             driver2_pos = results.loc[results['Abbreviation'] == driver2, 'Position'].values[0]
 
             # Plotting
-            plt.suptitle(
+            fig.suptitle(
                 f"{session.event['EventName']} {session.event.year} {session.name}\n"
                 f"Lap Time Comparison: {driver1} (P{int(driver1_pos)}) vs {driver2} (P{int(driver2_pos)})\n"
                 f"{driver1}: {formatted_time1} | {driver2}: {formatted_time2}",
                 fontsize=14
             )
-            plt.tight_layout()
+            fig.tight_layout()
 
         else:
             # Plotting
-            plt.suptitle(
+            fig.suptitle(
                 f"{session.event['EventName']} {session.event.year} {session.name}\n"
                 f"Lap Time Comparison: {driver1} vs {driver2}\n"
                 f"{driver1}: {formatted_time1} | {driver2}: {formatted_time2}",
                 fontsize=14
             )
-            plt.tight_layout()
+            fig.tight_layout()
 
     return fig
 
 # Plot 3: Maximum Speeds Compared to Best Lap Times
-def plot_max_speeds(session):
-    drivers = session.laps["Driver"].unique()
-    max_speeds = {}
-    best_laps = {}
-    team_colors = {}
+@requires(LAPS)
+@dark_style
+def plot_max_speeds(session, profile=None):
+    table = max_speed_table(session)
 
-    for driver in drivers:
-        laps = session.laps.pick_drivers(driver)
-        if laps.empty:
-            continue  # Skip drivers with no laps
-        
-        max_speeds[driver] = laps["SpeedST"]
-        
-        fastest_lap = laps.pick_fastest()
-        if fastest_lap is not None:
-            best_laps[driver] = fastest_lap["LapTime"]
-        else:
-            st.warning(f"No valid fastest lap for **{driver}**.")
-            continue  
+    for driver in table.loc[table["BestLapTime"].isna(), "Driver"]:
+        diagnostics.warn(f"No valid fastest lap for **{driver}**.")
+    table = table.dropna(subset=["BestLapTime"])
 
-        team = laps.iloc[0]["Team"]
-        team_colors[driver] = TEAM_COLORS.get(team, "gray")
-
-    valid_drivers = list(best_laps.keys())
-    delta_times = [(best_laps[drv] - min(best_laps.values())).total_seconds() for drv in valid_drivers]
-    speeds = [max_speeds[drv].max() for drv in valid_drivers]
-    colors = [team_colors[drv] for drv in valid_drivers]
+    valid_drivers = table["Driver"]
+    delta_times = table["Delta"]
+    speeds = table["MaxSpeedST"]
+    colors = [TEAM_COLORS.get(team, "gray") for team in table["Team"]]
 
     # Create figure for the plot
-    fig, ax = plt.subplots(figsize=(16, 9), dpi=1000)
+    fig = figures.new_figure(figsize=(16, 9), dpi=profile_dpi(profile))
+    ax = fig.subplots()
     ax.scatter(delta_times, speeds, color=colors, edgecolors="white", s=100)
 
     # Annotate each point with the driver's name
@@ -684,79 +1131,59 @@ def plot_max_speeds(session):
     ax.set_title(f"{session.event['EventName']} {session.event.year} {session.name}\n" 
                  "Maximum Speeds vs Best Lap Time",fontsize=14)
     ax.grid(True, linestyle="--", alpha=0.5)
-    plt.style.use("dark_background")
-    plt.tight_layout()
+    fig.tight_layout()
 
     return fig
 
 # Plot 4: Track Dominance
-def plot_track_dominance(session, driver1, driver2):
-    plt.style.use("dark_background")
+@requires(LAPS, TELEMETRY, CIRCUIT)
+@dark_style
+def plot_track_dominance(session, driver1, driver2, n_subsectors=25, profile=None):
+    import telemetry_store
 
-    # Pick fastst lap
-    lapdata1 = session.laps.pick_drivers(driver1).pick_fastest()
-    lapdata2 = session.laps.pick_drivers(driver2).pick_fastest()
+    # Fastest laps of both drivers, resampled on the distance grid of the circuit
+    store = telemetry_store.telemetry_store(session, [driver1, driver2])
+    info1 = store.driver_info(driver1)
+    info2 = store.driver_info(driver2)
 
     # Be sure drivers participated to the session
-    if lapdata1 is None:
-        st.warning(f"No laps completed for **{driver1}** in {session.name}, probably crash or substituted by a rookie. Cannot display track dominance comparison with {driver2}.")
+    if info1 is None:
+        diagnostics.warn(f"No laps completed for **{driver1}** in {session.name}, probably crash or substituted by a rookie. Cannot display track dominance comparison with {driver2}.")
         return None
-    if lapdata2 is None:
-        st.warning(f"No laps completed for **{driver2}** in {session.name}, probably crash or substituted by a rookie. Cannot display track dominance comparison with {driver1}.")
+    if info2 is None:
+        diagnostics.warn(f"No laps completed for **{driver2}** in {session.name}, probably crash or substituted by a rookie. Cannot display track dominance comparison with {driver1}.")
         return None
     else:
 
-        lap1 = lapdata1.get_telemetry().add_distance()
-        lap2 = lapdata2.get_telemetry().add_distance()
-
-        driver1_team = lapdata1["Team"]
-        driver2_team = lapdata2["Team"]
+        color_driver1 = TEAM_COLORS.get(info1["Team"], 'gray')
+        color_driver2 = TEAM_COLORS.get(info2["Team"], 'gray')
 
-        color_driver1 = TEAM_COLORS.get(driver1_team, 'gray')
-        color_driver2 = TEAM_COLORS.get(driver2_team, 'gray')
+        # Both laps up to the shorter one, the position of driver 1 draws the track
+        drivers = [driver1, driver2]
+        points = store.common_points(drivers)
+        speeds = store.channel("Speed", drivers, points)
+        x, y = store.channel("X", [driver1], points)[0], store.channel("Y", [driver1], points)[0]
 
-        max_distance = min(lap1['Distance'].max(), lap2['Distance'].max())
-        lap1 = lap1[lap1['Distance'] <= max_distance]
-        lap2 = lap2[lap2['Distance'] <= max_distance]
-
-        # Subdivide in n subsectors the track
-        n_subsectors = 25
-        sector_bounds = np.linspace(0, max_distance, n_subsectors + 1)
-
-        # Interpolate lap data
-        lap1_interp = {}
-        lap2_interp = {}
-        for var in ['X', 'Y', 'Speed']:
-            interp1 = interp1d(lap1['Distance'], lap1[var], kind='linear', fill_value='extrapolate')
-            interp2 = interp1d(lap2['Distance'], lap2[var], kind='linear', fill_value='extrapolate')
-            lap1_interp[var] = interp1
-            lap2_interp[var] = interp2
+        # Subdivide in n subsectors the track and average the speeds of both drivers in each
+        avg_speeds, subsector = subsector_means(speeds, n_subsectors)
+        driver1_faster = avg_speeds[0] > avg_speeds[1]
 
         # Initialize figure
-        fig = plt.figure(figsize=(16, 9), dpi=1000)
+        fig = figures.new_figure(figsize=(16, 9), dpi=profile_dpi(profile))
         spec = gridspec.GridSpec(ncols=2, nrows=1, width_ratios=[4, 1], figure=fig)
         ax_track = fig.add_subplot(spec[0])
         ax_legend = fig.add_subplot(spec[1])
 
-        for i in range(n_subsectors):
-            d_start = sector_bounds[i]
-            d_end = sector_bounds[i+1]
-            fine_distance = np.linspace(d_start, d_end, 200)
-
-            avg_speed1 = lap1_interp['Speed'](fine_distance).mean()
-            avg_speed2 = lap2_interp['Speed'](fine_distance).mean()
-
-            faster_driver = driver1 if avg_speed1 > avg_speed2 else driver2
-            color = color_driver1 if faster_driver == driver1 else color_driver2
-
-            x = lap1_interp['X'](fine_distance)
-            y = lap1_interp['Y'](fine_distance)
-
-            ax_track.plot(x, y, color=color, linewidth=2)
+        # Whole track as a single collection, each segment colored by the faster driver of its subsector
+        track = np.column_stack([x, y])
+        segments = np.stack([track[:-1], track[1:]], axis=1)
+        segment_colors = np.where(driver1_faster[subsector[:-1]], color_driver1, color_driver2)
+        ax_track.add_collection(LineCollection(segments, colors=segment_colors.tolist(), linewidths=2, capstyle='round'))
+        ax_track.autoscale_view()
 
         # Start marker
-        ax_track.plot(lap1['X'].iloc[0], lap1['Y'].iloc[0], marker='.', color='white', markersize=8, zorder=10)
-        ax_track.text(lap1['X'].iloc[0], lap1['Y'].iloc[0], "Start", fontsize=9, fontweight='bold', ha='left', va='bottom', color='white', zorder=11)
+        ax_track.plot(x[0], y[0], marker='.', color='white', markersize=8, zorder=10)
+        ax_track.text(x[0], y[0], "Start", fontsize=9, fontweight='bold', ha='left', va='bottom', color='white', zorder=11)
 
         # Corner numbers
         circuit_info = session.get_circuit_info()
@@ -765,13 +1192,10 @@ def plot_track_dominance(session, driver1, driver2):
                         bbox=dict(facecolor='white', edgecolor='none', alpha=0.7, boxstyle='round,pad=0.2'))
 
         # Start of sector marker
-        sector1_dist = lap1[lap1["Time"] <= lapdata1["Sector1Time"]].iloc[-1]["Distance"]
-        sector2_dist = lap1[lap1["Time"] <= (lapdata1["Sector1Time"] + lapdata1["Sector2Time"])].iloc[-1]["Distance"]
-
-        x_s1 = lap1_interp["X"](sector1_dist)
-        y_s1 = lap1_interp["Y"](sector1_dist)
-        x_s2 = lap1_interp["X"](sector2_dist)
-        y_s2 = lap1_interp["Y"](sector2_dist)
+        s1 = min(store.point_at(info1["Sector1Distance"]), points - 1)
+        s2 = min(store.point_at(info1["Sector2Distance"]), points - 1)
+        x_s1, y_s1 = x[s1], y[s1]
+        x_s2, y_s2 = x[s2], y[s2]
 
         ax_track.plot(x_s1, y_s1, marker='|', color='white', markersize=10, markeredgewidth=2, zorder=10)
         ax_track.plot(x_s2, y_s2, marker='|', color='white', markersize=10, markeredgewidth=2, zorder=10)
@@ -788,18 +1212,12 @@ def plot_track_dominance(session, driver1, driver2):
             spine.set_linewidth(1.5)
 
         ax_legend.axis('off')
-        lap_time1 = lapdata1["LapTime"].total_seconds()
-        lap_time2 = lapdata2["LapTime"].total_seconds()
-
-        def format_time(t):
-            minutes = int(t // 60)
-            seconds = int(t % 60)
-            millis = int((t - int(t)) * 1000)
-            return f"{minutes}:{seconds:02}.{millis:03}"
+        lap_time1 = info1["LapTime"]
+        lap_time2 = info2["LapTime"]
 
         legend_elements = [
-            Patch(facecolor=color_driver1, label=f"{driver1}\nS1: {lapdata1['Sector1Time'].total_seconds():.3f}s\nS2: {lapdata1['Sector2Time'].total_seconds():.3f}s\nS3: {lapdata1['Sector3Time'].total_seconds():.3f}s"),
-            Patch(facecolor=color_driver2, label=f"{driver2}\nS1: {lapdata2['Sector1Time'].total_seconds():.3f}s\nS2: {lapdata2['Sector2Time'].total_seconds():.3f}s\nS3: {lapdata2['Sector3Time'].total_seconds():.3f}s"),
+            Patch(facecolor=color_driver1, label=f"{driver1}\nS1: {info1['Sector1Time']:.3f}s\nS2: {info1['Sector2Time']:.3f}s\nS3: {info1['Sector3Time']:.3f}s"),
+            Patch(facecolor=color_driver2, label=f"{driver2}\nS1: {info2['Sector1Time']:.3f}s\nS2: {info2['Sector2Time']:.3f}s\nS3: {info2['Sector3Time']:.3f}s"),
         ]
 
         ax_legend.legend(
@@ -821,18 +1239,179 @@ def plot_track_dominance(session, driver1, driver2):
             driver2_pos = results.loc[results['Abbreviation'] == driver2, 'Position'].values[0]
             fig.suptitle(f"{session.event['EventName']} {session.event.year} {session.name}\n"
                         f"Track Dominance: {driver1} (P{int(driver1_pos)}) vs {driver2} (P{int(driver2_pos)})\n"
-                        f"{driver1}: {format_time(lap_time1)} | {driver2}: {format_time(lap_time2)}",
+                        f"{driver1}: {_format_lap_time(lap_time1)} | {driver2}: {_format_lap_time(lap_time2)}",
                         fontsize=14)
         else:
             fig.suptitle(f"{session.event['EventName']} {session.event.year} {session.name}\n"
                         f"Track Dominance: {driver1} vs {driver2}\n"
-                        f"{driver1}: {format_time(lap_time1)} | {driver2}: {format_time(lap_time2)}",
+                        f"{driver1}: {_format_lap_time(lap_time1)} | {driver2}: {_format_lap_time(lap_time2)}",
                         fontsize=14)
 
-        plt.tight_layout()
+        fig.tight_layout()
+    return fig
+
+
+
+# Line color and style of every driver of a comparison: the team color,
+# lighter and dashed for the second driver of a team
+def driver_styles(teams, team_colors=None):
+    team_colors = team_colors or TEAM_COLORS
+    styles = []
+    seen = defaultdict(int)
+    for team in teams:
+        color = np.array(mcolors.to_rgb(team_colors.get(team, 'gray')))
+        if seen[team]:
+            styles.append((mcolors.to_hex(color * 0.55 + 0.45), '--'))
+        else:
+            styles.append((mcolors.to_hex(color), '-'))
+        seen[team] += 1
+    return styles
+
+# Telemetry store of a comparison and its drivers with a timed lap, fastest first.
+# drivers=None compares the whole grid
+def comparison_drivers(session, drivers=None):
+    import telemetry_store
+
+    if drivers is None:
+        drivers = list(session.laps["Driver"].dropna().unique())
+    store = telemetry_store.telemetry_store(session, drivers)
+
+    timed = []
+    for driver in drivers:
+        if not store.has_driver(driver):
+            diagnostics.warn(f"No laps completed for **{driver}** in {session.name}, left out of the comparison.")
+        elif driver not in timed:
+            timed.append(driver)
+    return store, sorted(timed, key=lambda driver: store.driver_info(driver)["LapTime"])
+
+# One line per row of values along grid, all drivers in a single collection
+def _driver_lines(ax, grid, values, styles):
+    lines = np.stack([np.broadcast_to(grid, values.shape), values], axis=-1)
+    ax.add_collection(LineCollection(lines, colors=[color for color, _ in styles],
+                                     linestyles=[style for _, style in styles], linewidths=1.2))
+    ax.autoscale_view()
+
+# Lap time in seconds as m:ss.mmm
+def _format_lap_time(t):
+    minutes = int(t // 60)
+    seconds = int(t % 60)
+    millis = int((t - int(t)) * 1000)
+    return f"{minutes}:{seconds:02}.{millis:03}"
+
+# Plot 5: Lap Time Comparison of several drivers, gaps to a reference driver (default: the fastest)
+@requires(LAPS, TELEMETRY)
+@dark_style
+def plot_multi_lap_comparison(session, drivers=None, reference=None, profile=None):
+    store, drivers = comparison_drivers(session, drivers)
+    if len(drivers) < 2:
+        diagnostics.warn(f"At least two drivers with a timed lap are needed to compare laps in {session.name}.")
+        return None
+    if reference not in drivers:
+        reference = drivers[0]
+
+    infos = [store.driver_info(driver) for driver in drivers]
+    styles = driver_styles([info["Team"] for info in infos])
+
+    # Every channel is one row per driver on the common part of the grid
+    points = store.common_points(drivers)
+    grid = store.grid[:points]
+    speed = store.channel("Speed", drivers, points)
+    throttle = store.channel("Throttle", drivers, points)
+    gaps = time_deltas(store.channel("Time", drivers, points), drivers.index(reference))
+
+    fig = figures.new_figure(figsize=(16, 9), dpi=profile_dpi(profile))
+    axs = fig.subplots(3, 1, sharex=True)
+
+    _driver_lines(axs[0], grid, speed, styles)
+    axs[0].set_ylabel("Speed (km/h)")
+    _driver_lines(axs[1], grid, throttle, styles)
+    axs[1].set_ylabel("Throttle (%)")
+    _driver_lines(axs[2], grid, gaps, styles)
+    axs[2].set_ylabel(f"Gap to {reference} (s)")
+    axs[2].axhline(0, color="gray", linestyle="--", alpha=0.7)
+    axs[2].set_xlabel("Distance (m)")
+
+    # Sector markers of the reference lap
+    reference_info = store.driver_info(reference)
+    for ax in axs:
+        ax.axvline(x=reference_info["Sector1Distance"], color='white', linestyle='--', linewidth=1.2, alpha=0.8)
+        ax.axvline(x=reference_info["Sector2Distance"], color='white', linestyle='--', linewidth=1.2, alpha=0.8)
+        ax.grid(True, linestyle="--", alpha=0.5)
+
+    # Legend with the lap time and the final gap of every driver
+    handles = [Line2D([0], [0], color=color, linestyle=style,
+                      label=f"{driver} {_format_lap_time(info['LapTime'])} ({info['LapTime'] - reference_info['LapTime']:+.3f})")
+               for driver, info, (color, style) in zip(drivers, infos, styles)]
+    fig.legend(handles=handles, loc='center right', fontsize=9, title="Fastest laps", title_fontsize=10)
+
+    fig.suptitle(f"{session.event['EventName']} {session.event.year} {session.name}\n"
+                 f"Lap Time Comparison: {len(drivers)} drivers, gaps to {reference} ({_format_lap_time(reference_info['LapTime'])})",
+                 fontsize=14)
+    fig.tight_layout(rect=[0, 0, 0.86, 1])
+
     return fig
 
+# Plot 6: Track Dominance of several drivers, every mini-sector in the color of its fastest driver
+@requires(LAPS, TELEMETRY, CIRCUIT)
+@dark_style
+def plot_multi_track_dominance(session, drivers=None, n_subsectors=25, profile=None):
+    store, drivers = comparison_drivers(session, drivers)
+    if len(drivers) < 2:
+        diagnostics.warn(f"At least two drivers with a timed lap are needed for the track dominance in {session.name}.")
+        return None
 
+    infos = [store.driver_info(driver) for driver in drivers]
+    colors = np.array([color for color, _ in driver_styles([info["Team"] for info in infos])])
+
+    # Fastest driver of every subsector from the speeds of all drivers at once, the fastest lap draws the track
+    points = store.common_points(drivers)
+    speeds = store.channel("Speed", drivers, points)
+    x, y = store.channel("X", drivers[:1], points)[0], store.channel("Y", drivers[:1], points)[0]
+    avg_speeds, subsector = subsector_means(speeds, n_subsectors)
+    fastest = np.argmax(avg_speeds, axis=0)
+    wins = np.bincount(fastest, minlength=len(drivers))
+
+    fig = figures.new_figure(figsize=(16, 9), dpi=profile_dpi(profile))
+    spec = gridspec.GridSpec(ncols=2, nrows=1, width_ratios=[4, 1], figure=fig)
+    ax_track = fig.add_subplot(spec[0])
+    ax_legend = fig.add_subplot(spec[1])
+
+    track = np.column_stack([x, y])
+    segments = np.stack([track[:-1], track[1:]], axis=1)
+    ax_track.add_collection(LineCollection(segments, colors=colors[fastest[subsector[:-1]]].tolist(), linewidths=2, capstyle='round'))
+    ax_track.autoscale_view()
+
+    # Start marker
+    ax_track.plot(x[0], y[0], marker='.', color='white', markersize=8, zorder=10)
+    ax_track.text(x[0], y[0], "Start", fontsize=9, fontweight='bold', ha='left', va='bottom', color='white', zorder=11)
+
+    # Corner numbers
+    circuit_info = session.get_circuit_info()
+    for _, corner in circuit_info.corners.iterrows():
+        ax_track.text(corner["X"], corner["Y"], str(corner["Number"]), fontsize=8, color='black', ha='center', va='center',
+                    bbox=dict(facecolor='white', edgecolor='none', alpha=0.7, boxstyle='round,pad=0.2'))
+
+    ax_track.set_xticks([])
+    ax_track.set_yticks([])
+    for spine in ax_track.spines.values():
+        spine.set_visible(True)
+        spine.set_color('white')
+        spine.set_linewidth(1.5)
+
+    ax_legend.axis('off')
+    legend_elements = [Patch(facecolor=color, label=f"{driver}  {_format_lap_time(info['LapTime'])}  {count}/{avg_speeds.shape[1]}")
+                       for driver, info, color, count in zip(drivers, infos, colors, wins)]
+    ax_legend.legend(handles=legend_elements, loc='center', title="Mini-sectors won", fontsize=10, title_fontsize=11,
+                     framealpha=0.95, borderpad=1.2, labelspacing=0.8)
+
+    fig.suptitle(f"{session.event['EventName']} {session.event.year} {session.name}\n"
+                 f"Track Dominance: {len(drivers)} drivers, {avg_speeds.shape[1]} mini-sectors",
+                 fontsize=14)
+    fig.tight_layout()
+
+    return fig
 
 if __name__ == "__main__":
-    gui.run_gui()
+    # Command line batch rendering, the web app is started with `streamlit run gui.py`
+    import batch
+    batch.main()
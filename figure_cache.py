@@ -0,0 +1,154 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import session_cache
+
+logger = logging.getLogger(__name__)
+
+# Bump when a plot changes its output, so old cached figures are not served anymore
+CACHE_VERSION = 3
+
+# None keeps the figures in the session cache directory, wherever configure_cache() puts it
+FIGURE_CACHE_DIR = os.environ.get("F1_FIGURE_CACHE_DIR")
+FIGURE_CACHE_MAX_MB = int(os.environ.get("F1_FIGURE_CACHE_MAX_MB", "512"))
+
+_lock = threading.Lock()
+_index = None  # path -> size, least recently used first
+_index_dir = None
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+# Change the cache location or size cap
+def configure_figure_cache(cache_dir=None, max_mb=None):
+    global FIGURE_CACHE_DIR, FIGURE_CACHE_MAX_MB, _index
+    with _lock:
+        if cache_dir is not None:
+            FIGURE_CACHE_DIR = cache_dir
+            _index = None
+        if max_mb is not None:
+            FIGURE_CACHE_MAX_MB = int(max_mb)
+
+
+# Directory the figures are read from and written to right now
+def figure_cache_dir():
+    return FIGURE_CACHE_DIR or os.path.join(session_cache.CACHE_DIR, "figures")
+
+
+# Content address of a rendered figure. plot_settings are the inputs of the plots that don't come
+# from their arguments (e.g. the fuel model set by environment variables)
+def figure_key(session_id, plot_name, args, profile_settings, plot_settings=None):
+    payload = json.dumps([CACHE_VERSION, session_id, plot_name, args, profile_settings, plot_settings], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _path(key, file_format):
+    return os.path.join(figure_cache_dir(), key[:2], f"{key}.{file_format}")
+
+
+# Build the LRU index from the files already on disk, oldest first
+def _load_index():
+    global _index, _index_dir
+    cache_dir = figure_cache_dir()
+    # Rebuilt when the session cache moved since
+    if _index is not None and _index_dir == cache_dir:
+        return
+
+    files = []
+    if os.path.isdir(cache_dir):
+        for root, _, names in os.walk(cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                files.append((os.path.getmtime(path), path, os.path.getsize(path)))
+
+    _index = OrderedDict((path, size) for _, path, size in sorted(files))
+    _index_dir = cache_dir
+
+
+# Cached bytes of a figure, or None
+def get(key, file_format):
+    path = _path(key, file_format)
+    with _lock:
+        _load_index()
+        if path not in _index:
+            if not os.path.isfile(path):
+                _stats["misses"] += 1
+                return None
+            # Written by another process since the index was built
+            _index[path] = os.path.getsize(path)
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            # Removed behind our back
+            _index.pop(path, None)
+            _stats["misses"] += 1
+            return None
+
+        _index.move_to_end(path)
+        _stats["hits"] += 1
+
+    # File mtime keeps the LRU order across restarts
+    os.utime(path)
+    return data
+
+
+def put(key, file_format, data):
+    path = _path(key, file_format)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Write to a temporary file first so readers never see half a figure
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+    with _lock:
+        _load_index()
+        _index[path] = len(data)
+        _index.move_to_end(path)
+        _evict()
+
+
+# Remove least recently used figures until the cache fits in FIGURE_CACHE_MAX_MB
+def _evict():
+    max_bytes = FIGURE_CACHE_MAX_MB * 1024 * 1024
+    total = sum(_index.values())
+
+    while total > max_bytes and len(_index) > 1:
+        path, size = _index.popitem(last=False)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+        _stats["evictions"] += 1
+        logger.info("Evicted cached figure %s", path)
+
+
+def clear():
+    global _index
+    with _lock:
+        _load_index()
+        for path in _index:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        _index = OrderedDict()
+
+
+def get_cache_stats():
+    with _lock:
+        _load_index()
+        stats = dict(_stats)
+        stats["figures"] = len(_index)
+        stats["size_bytes"] = sum(_index.values())
+
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["cache_dir"] = figure_cache_dir()
+    return stats
@@ -0,0 +1,108 @@
+import os
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from matplotlib.figure import Figure
+
+logger = logging.getLogger(__name__)
+
+# Figures alive at the same time. Past the cap the oldest ones are closed, they are leaks:
+# a figure lives from its plot function until it is encoded
+MAX_LIVE_FIGURES = int(os.environ.get("F1_MAX_LIVE_FIGURES", "16"))
+
+_lock = threading.Lock()
+_live = OrderedDict()
+_stats = {"created": 0, "closed": 0, "closed_by_cap": 0}
+
+
+# Figure not registered with pyplot, tracked until close_figure()
+def new_figure(*args, **kwargs):
+    fig = Figure(*args, **kwargs)
+
+    with _lock:
+        _stats["created"] += 1
+        _live[id(fig)] = weakref.ref(fig)
+        # Drop the entries of figures already garbage collected
+        for key in [key for key, ref in _live.items() if ref() is None]:
+            del _live[key]
+
+        overflow = []
+        while len(_live) > MAX_LIVE_FIGURES:
+            _, ref = _live.popitem(last=False)
+            if ref() is None:
+                continue
+            overflow.append(ref())
+
+            _stats["closed_by_cap"] += 1
+
+    for old in overflow:
+        logger.warning("More than %d live figures, closing the oldest one (%s)", MAX_LIVE_FIGURES, _title(old))
+        _release(old)
+    return fig
+
+
+def _title(fig):
+    title = fig._suptitle.get_text() if fig._suptitle is not None else ""
+    return title.splitlines()[0] if title else "untitled"
+
+
+# Figures and their axes point to each other, so they only go with the cycle collector.
+# Clearing breaks the cycles and frees the artists right away
+def _release(fig):
+    fig.clear()
+
+
+def close_figure(fig):
+    if fig is None:
+        return
+    with _lock:
+        if _live.pop(id(fig), None) is None:
+            return
+        _stats["closed"] += 1
+    _release(fig)
+
+
+# Closes the figure at the end of the block, whatever happens inside:
+#   with figures.closing(plot(...)) as fig:
+#       data = figure_bytes(fig)
+@contextmanager
+def closing(fig):
+    try:
+        yield fig
+    finally:
+        close_figure(fig)
+
+
+def live_figures():
+    with _lock:
+        return sum(1 for ref in _live.values() if ref() is not None)
+
+
+# Resident memory of this process in bytes, None where it can't be read
+def process_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return None
+
+
+# Live figures, figure counters and process RSS, logged with label (e.g. after every request)
+def memory_report(label=""):
+    with _lock:
+        report = dict(_stats)
+    report["live_figures"] = live_figures()
+    rss = process_rss()
+    report["rss_mb"] = rss / 1024 / 1024 if rss is not None else None
+
+    logger.info("%s: %d live figures (%d created, %d closed, %d by the cap), RSS %s",
+                label or "memory", report["live_figures"], report["created"], report["closed"], report["closed_by_cap"],
+                f"{report['rss_mb']:.0f} MB" if report["rss_mb"] is not None else "unknown")
+    return report
@@ -1,105 +1,187 @@
+import time
+import threading
 import streamlit as st
-import f1_analysis
-import io
-import base64
+import timing
 
-def on_load_session(mode, year, grand_prix, session_type, driver1, driver2):
-    from f1_analysis import TEAM_COLORS
+# Plots whose underlying data can be downloaded: plot function name -> table function name
+PLOT_TABLES = {
+    'plot_max_speeds': 'max_speed_table',
+    'plot_race_pace': 'stint_pace_table',
+}
+
+def on_load_session(mode, year, grand_prix, session_type, driver1, driver2, n_minisectors=25, more_drivers=""):
+    # Heavy modules, imported on the first request (or already by prewarm_modules)
+    import f1_analysis
+    import figures
+    import loader
+    import render
 
     if not driver1 or not driver2:
         st.error("⚠️ Please enter both driver names.")
         return
-    
-    # Show loading spinner while loading the session and generating plots
-    with st.spinner("⏳ Loading session data and generating plots..."):
-        session = f1_analysis.load_session(mode, year, grand_prix, session_type)
-
-        if session:
-            st.toast("✅ Session loaded!", icon="📂")
-
-            if session_type == "Qualifying":
-                fig = f1_analysis.plot_session_ranking(session)
-                show_fig_with_download('⏱️ Session Ranking', fig, 'session_ranking_Q')
-
-                fig = f1_analysis.plot_best_laps(session)
-                show_fig_with_download('🏎️ Best Lap Per Team', fig, 'best_lap_per_team_Q')
-
-                fig = f1_analysis.plot_lap_comparison(session, driver1, driver2)
-                if fig is not None:
-                    show_fig_with_download('📈 Lap Time Comparison', fig, 'lap_time_comparison_Q')
-
-                fig = f1_analysis.plot_track_dominance(session, driver1, driver2)
-                if fig is not None:
-                    show_fig_with_download('🏁 Track Dominance', fig, 'track_dominance_Q')
-
-                fig = f1_analysis.plot_max_speeds(session)
-                show_fig_with_download('🚀 Max Speeds vs Lap Time', fig, 'max_speeds_vs_laptime_Q')
-
-            elif session_type == "Sprint Qualifying":
-                fig = f1_analysis.plot_session_ranking(session)
-                show_fig_with_download('⏱️ Session Ranking', fig, 'session_ranking_SQ')
-
-                fig = f1_analysis.plot_best_laps(session)
-                show_fig_with_download('🏎️ Best Lap Per Team', fig, 'best_lap_per_team_SQ')
-
-                fig = f1_analysis.plot_lap_comparison(session, driver1, driver2)
-                if fig is not None:
-                    show_fig_with_download('📈 Lap Time Comparison', fig, 'lap_time_comparison_SQ')
-
-                fig = f1_analysis.plot_track_dominance(session, driver1, driver2)
-                if fig is not None:
-                    show_fig_with_download('🏁 Track Dominance', fig, 'track_dominance_SQ')
-
-                fig = f1_analysis.plot_max_speeds(session)
-                show_fig_with_download('🚀 Max Speeds vs Lap Time', fig, 'max_speeds_vs_laptime_SQ')
-
-            elif session_type == "Race":
-                fig = f1_analysis.plot_race_ranking_table(session)
-                show_fig_with_download('📋 Final Race Classification', fig, 'final_race_classification_R')
-
-                fig = f1_analysis.plot_stint_comparison(session, [driver1, driver2], TEAM_COLORS)
-                show_fig_with_download('🏁 Stint Comparison', fig, 'stint_comparison_R')
-
-                fig = f1_analysis.plot_lap_time_distribution(session, TEAM_COLORS)
-                show_fig_with_download('📊 Lap Time Distribution', fig, 'lap_time_distribution_R')
-
-            elif session_type == "Sprint Race":
-                fig = f1_analysis.plot_race_ranking_table(session)
-                show_fig_with_download('📋 Final Race Classification', fig, 'final_race_classification_SR')
-
-                fig = f1_analysis.plot_stint_comparison(session, [driver1, driver2], TEAM_COLORS)
-                show_fig_with_download('🏁 Stint Comparison', fig, 'stint_comparison_SR')
-
-                fig = f1_analysis.plot_lap_time_distribution(session, TEAM_COLORS)
-                show_fig_with_download('📊 Lap Time Distribution', fig, 'lap_time_distribution_SR')
-
-            elif session_type in ["FP1", "FP2", "FP3"]:
-                fig = f1_analysis.plot_free_practice_ranking(session)
-                show_fig_with_download('⏱️ Practice Session Ranking', fig, 'session_ranking_FP')
-
-                fig = f1_analysis.plot_best_laps(session)
-                show_fig_with_download('🏎️ Best Lap Per Team', fig, 'best_lap_per_team_FP')
 
-                fig = f1_analysis.plot_lap_time_distribution(session, TEAM_COLORS)
-                show_fig_with_download('📊 Lap Time Distribution', fig, 'lap_time_distribution_FP')
+    # Group of the multi-driver plots, drawn only when more drivers are given ("ALL" is the whole grid)
+    drivers = parse_drivers(more_drivers)
+    plots = render.SESSION_PLOTS.get(session_type, [])
+    if drivers is not None and not drivers:
+        plots = [plot for plot in plots if plot[2] not in render.GROUP_ARGS]
+    elif drivers is not None:
+        drivers = list(dict.fromkeys([driver1, driver2] + drivers))
+
+    # Only load the session data these plots need
+    requirements = f1_analysis.plot_requirements([getattr(f1_analysis, plot_name) for _, plot_name, _, _ in plots])
+    session_spec = (mode, year, grand_prix, session_type, requirements)
+    jobs = [(plot_name, render.plot_args(arg_kind, driver1, driver2, n_minisectors, drivers), filename) for _, plot_name, arg_kind, filename in plots]
+
+    # Loading and drawing run in the background, this run only shows the progress and the figures.
+    # A new request supersedes the one this user was still waiting for
+    previous = st.session_state.get("load_job")
+    job = loader.submit(session_spec, jobs, f"{year} {grand_prix} {session_type}", current=previous)
+    if previous is not None and previous is not job:
+        previous.cancel()
+    st.session_state["load_job"] = job
+    st.session_state["render_stats"] = []
+
+    events_slot = st.container()
+    progress_bar = st.progress(0.0, text="⏳ Loading session data and generating plots...")
+    # One slot per plot keeps the page order while figures arrive in any order
+    slots = [st.container() for _ in plots]
+
+    shown = 0
+    loaded = False
+    while True:
+        progress = job.progress()
+        progress_bar.progress(len(progress["plots_done"]) / max(1, progress["plots_total"]), text=progress_text(progress))
+
+        if not loaded and (progress["loaded"] or progress["finished"]):
+            loaded = True
+            with events_slot:
+                show_events(job.events)
+            if job.session is not None:
+                st.toast("✅ Session loaded!", icon="📂")
+
+        # Cached figures come first, the others are drawn in parallel and shown as soon as they are done
+        for index, png_bytes, stats in job.new_results(shown):
+            shown += 1
+            with slots[index]:
+                show_events(stats["events"])
+            if png_bytes is None:
+                continue
+
+            title = plots[index][0]
+            plot_name, args, filename = jobs[index]
+            st.session_state["render_stats"].append(stats)
+            with slots[index]:
+                show_fig_with_download(
+                    title, png_bytes, filename,
+                    lambda profile, session=job.session, plot_name=plot_name, args=args: render.render_plot(session, plot_name, args, profile)[0],
+                    plot_table(job.session, plot_name)
+                )
+
+        if progress["finished"]:
+            break
+        time.sleep(PROGRESS_POLL_S)
+
+    progress_bar.empty()
+    # Nothing left to cancel. The finished job would otherwise keep the session and every figure
+    # in the state of this user, the download buttons only hold the session
+    if st.session_state.get("load_job") is job:
+        del st.session_state["load_job"]
+    # Spans of the background thread count for this request
+    timing.record(job.spans)
+    if progress["error"]:
+        st.error(f"⚠️ Something went wrong: {progress['error']}")
+    else:
+        st.success("✅ All plots generated successfully!")
 
-                fig = f1_analysis.plot_max_speeds(session)
-                show_fig_with_download('🚀 Max Speeds vs Lap Time', fig, 'max_speeds_vs_laptime_FP')
+    # Figures left open by this request and memory of the process, also in the log
+    st.session_state["memory_report"] = figures.memory_report(f"After {year} {grand_prix} {session_type}")
+    show_render_stats()
+
+# Seconds between two looks at a running request
+PROGRESS_POLL_S = 0.2
+
+# What a request is doing, from its timing spans (or fastf1 log messages, shown as they are)
+STAGE_LABELS = {
+    "waiting": "Waiting for a free loader",
+    "load_session_cached": "Looking for the session",
+    "load_session": "Loading the session",
+    "load_session.get_event": "Finding the event",
+    "load_session.get_session": "Finding the session",
+    "load_session.load": "Loading session data",
+    "load_session.summary": "Computing the session tables",
+    "ensure_session_data.load": "Loading telemetry",
+    "get_telemetry": "Merging telemetry",
+    "telemetry_store.build": "Resampling telemetry",
+    "race_pace": "Computing the race pace",
+    "savefig": "Encoding a figure",
+}
+
+def progress_text(progress):
+    stage = progress["stage"]
+    stage = STAGE_LABELS.get(stage) or (f"Drawing {stage[len('plot_'):].replace('_', ' ')}" if stage.startswith("plot_") else stage)
+    return f"⏳ {stage} · {len(progress['plots_done'])}/{progress['plots_total']} plots · {progress['elapsed_s']:.0f} s"
+
+# "NOR, PIA HAM" -> ["NOR", "PIA", "HAM"], "ALL" -> None (the whole grid)
+def parse_drivers(text):
+    names = [name.upper() for name in text.replace(",", " ").split()]
+    if "ALL" in names:
+        return None
+    return names
+
+# Warnings and notes raised by the analysis code
+def show_events(events):
+    for event in events:
+        if event["level"] == "warning":
+            st.warning(event["message"])
+        else:
+            st.info(event["message"])
+
+# Callable returning the data behind a plot encoded as CSV or JSON, or None if the plot has no table
+def plot_table(session, plot_name):
+    import f1_analysis
+
+    table_name = PLOT_TABLES.get(plot_name)
+    if table_name is None:
+        return None
+    return lambda file_format: f1_analysis.table_bytes(getattr(f1_analysis, table_name)(session), file_format)
+
+# Import the analysis modules in a background thread, once per server process,
+# so the form shows immediately and the first request doesn't wait for matplotlib, fastf1 etc.
+@st.cache_resource
+def prewarm_modules():
+    thread = threading.Thread(target=_import_analysis_modules, name="prewarm-modules", daemon=True)
+    thread.start()
+    return thread
+
+def _import_analysis_modules():
+    import f1_analysis
+    import render
+    f1_analysis.preload_modules()
+
+# Load the sessions configured with F1_PREWARM / F1_PREWARM_LATEST into the cache, once per server process.
+# Returns the running prewarm.Prewarmer, or None if nothing is configured
+@st.cache_resource
+def start_session_prewarm():
+    import prewarm
+    return prewarm.start_from_env()
+
+def show_prewarm_progress(prewarmer):
+    if prewarmer is None:
+        return
 
-                fig = f1_analysis.plot_track_dominance(session, driver1, driver2)
-                if fig is not None:
-                    show_fig_with_download('🏁 Track Dominance', fig, 'track_dominance_FP')
-                
-                fig = f1_analysis.plot_lap_comparison(session, driver1, driver2)
-                if fig is not None:
-                    show_fig_with_download('📈 Lap Time Comparison', fig, 'lap_time_comparison_FP')
-                
+    progress = prewarmer.progress()
+    if progress["finished"]:
+        return
 
-        st.success("✅ All plots generated successfully!")
+    total = progress["total"]
+    st.progress(progress["done"] / total if total else 0.0, text=f"🔥 Preparing popular sessions: {progress['done']}/{total}")
 
 # Start Streamlit App
 def run_streamlit_app():
     st.set_page_config(page_title="F1 Analysis", layout="centered")
+    prewarm_modules()
+    prewarmer = start_session_prewarm()
 
     # Sidebar for How to Use
     with st.sidebar:
@@ -113,6 +195,9 @@ def run_streamlit_app():
             """,
             icon="🛠️"
         )
+        show_prewarm_progress(prewarmer)
+        # Filled at the end of the run, once the request is timed
+        timing_panel = st.container()
         st.markdown("---")
         st.markdown("Made with passion for F1 fans.<br>📩Contact Me formulatelemetryinfo@gmail.com", unsafe_allow_html=True)
 
@@ -164,6 +249,26 @@ def run_streamlit_app():
             driver1 = st.text_input("Driver 1", placeholder="e.g., VER")
             driver2 = st.text_input("Driver 2", placeholder="e.g., LEC")
 
+        more_drivers = st.text_input("More drivers to compare (optional)", placeholder="e.g., NOR, PIA, HAM or ALL for the whole grid")
+        n_minisectors = st.slider("Track Dominance mini-sectors", min_value=10, max_value=500, value=25, step=5)
+
+        # In the form: a widget outside it reruns the app on change, which clears the plots on the page
+        download_col, data_col = st.columns(2)
+        with download_col:
+            st.selectbox(
+                "📥 Download quality",
+                list(DOWNLOAD_PROFILES),
+                format_func=DOWNLOAD_PROFILES.get,
+                key="download_profile"
+            )
+        with data_col:
+            st.selectbox(
+                "📄 Data format",
+                list(DATA_FORMATS),
+                format_func=str.upper,
+                key="data_format"
+            )
+
         # Button in the form
         #submitted = st.form_submit_button("🚀 Load Session")
         _, center_col, _ = st.columns([1, 1, 1])
@@ -171,41 +276,119 @@ def run_streamlit_app():
             submitted = st.form_submit_button("🚀 Load Session", use_container_width=True)
 
     if submitted:
-        on_load_session(mode, year, grand_prix, session_type, driver1, driver2)
-
-# Faster byte conversion
-def get_fig_bytes(_fig):
-    buf = io.BytesIO()
-    _fig.savefig(buf, format="png", bbox_inches="tight")
-    buf.seek(0)
-    return buf.read()
-
-# Download button
-def show_fig_with_download(title, fig, filename):
-    fig_bytes = get_fig_bytes(fig)
-    b64 = base64.b64encode(fig_bytes).decode()
-
-    st.markdown(f"""
-        <div style="display: flex; align-items: center; gap: 6px;">
-            <h3 style="margin: 0;">{title}</h3>
-            <a href="data:file/png;base64,{b64}" download="{filename}.png" 
-               style="
-                   background-color: transparent;
-                   padding: 4px 6px;
-                   border: 0.5px solid #666666;
-                   border-radius: 6px;
-                   text-decoration: none;
-                   font-size: 16px;
-                   color: black;
-                   position: relative;
-                   top: -2px;
-               " title="Download figure">
-                📥
-            </a>
-        </div>
-    """, unsafe_allow_html=True)
-
-    st.pyplot(fig, use_container_width=True)
+        label = f"{year} {grand_prix} {session_type}"
+        start = time.perf_counter()
+        with timing.collect() as spans:
+            on_load_session(mode, year, grand_prix, session_type, driver1, driver2, n_minisectors, more_drivers)
+        st.session_state["timing_report"] = timing.report(spans, label, time.perf_counter() - start)
+
+    with timing_panel:
+        show_timing_report()
+
+# Labels of the render profiles offered for downloads
+DOWNLOAD_PROFILES = {
+    "download": "🖼️ High-res PNG",
+    "print": "🖨️ Print PDF",
+    "vector": "🧩 Vector SVG",
+    "screen": "🖥️ As shown (PNG)",
+}
+
+MIME_TYPES = {"png": "image/png", "pdf": "application/pdf", "svg": "image/svg+xml"}
+
+# Formats offered for the data behind a plot
+DATA_FORMATS = {"csv": "text/csv", "json": "application/json"}
+
+# Figure title with a download button.
+# render_download(profile) returns the figure encoded with another render profile,
+# render_table(file_format), if given, returns the data behind the figure
+@timing.timed()
+def show_fig_with_download(title, png_bytes, filename, render_download, render_table=None):
+    import f1_analysis
+
+    profile = st.session_state.get("download_profile", "download")
+    file_format = f1_analysis.RENDER_PROFILES[profile]["format"]
+
+    if profile == f1_analysis.DEFAULT_PROFILE:
+        # Reuse the bytes already shown on the page
+        download_data = png_bytes
+    else:
+        # The full resolution file is only rendered when the button is clicked
+        download_data = lambda: render_download(profile)
+
+    if render_table is None:
+        title_col, button_col = st.columns([12, 1], vertical_alignment="center")
+    else:
+        title_col, table_col, button_col = st.columns([11, 1, 1], vertical_alignment="center")
+        data_format = st.session_state.get("data_format", "csv")
+        with table_col:
+            st.download_button(
+                "📄",
+                data=lambda: render_table(data_format),
+                file_name=f"{filename}.{data_format}",
+                mime=DATA_FORMATS[data_format],
+                help="Download data",
+                on_click="ignore"
+            )
+
+    with title_col:
+        st.markdown(f'<h3 style="margin: 0;">{title}</h3>', unsafe_allow_html=True)
+    with button_col:
+        st.download_button(
+            "📥",
+            data=download_data,
+            file_name=f"{filename}.{file_format}",
+            mime=MIME_TYPES[file_format],
+            help="Download figure",
+            on_click="ignore"
+        )
+
+    with timing.span("st.image"):
+        st.image(png_bytes, width="stretch")
+
+# Where the time of the last request went, stage by stage (sidebar debug panel)
+def show_timing_report():
+    report = st.session_state.get("timing_report")
+    if not report:
+        return
+
+    with st.expander("🐞 Last request timing"):
+        st.caption(f"{report['label']}: {report['wall_s']:.2f} s")
+        st.dataframe(
+            [
+                {
+                    "Stage": "· " * row["Depth"] + row["Stage"],
+                    "Calls": row["Calls"],
+                    "Total (ms)": round(row["Total (ms)"], 1),
+                    "Mean (ms)": round(row["Mean (ms)"], 1),
+                }
+                for row in report["stages"]
+            ],
+            hide_index=True
+        )
+
+# Encode time and payload of every figure of the last request
+def show_render_stats():
+    stats = st.session_state.get("render_stats", [])
+    if not stats:
+        return
+
+    with st.expander("⚙️ Render stats"):
+        st.dataframe(
+            [
+                {
+                    "Figure": s["figure"],
+                    "Encode (ms)": round(s["encode_s"] * 1000, 1),
+                    "Size (KB)": round(s["size_bytes"] / 1024, 1),
+                    "Cached": s["cache_hit"],
+                }
+                for s in stats
+            ],
+            hide_index=True
+        )
+        memory = st.session_state.get("memory_report")
+        if memory:
+            rss = f"{memory['rss_mb']:.0f} MB" if memory["rss_mb"] is not None else "unknown"
+            st.caption(f"{memory['live_figures']} live figures, process memory {rss}")
 
 if __name__ == "__main__":
     run_streamlit_app()
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import diagnostics
+import timing
+
+logger = logging.getLogger(__name__)
+
+# App requests loaded and drawn at the same time, in background threads of the server process
+LOAD_WORKERS = int(os.environ.get("F1_LOAD_WORKERS", "4"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Requests still running, by key: the same request from another user joins the running job
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+# Progress callbacks of the threads running a job, fed by the fastf1 log and the timing spans
+_stage_listeners = {}
+
+
+# fastf1 logs every step of Session.load() ("Processing timing data...", "Loading car data...").
+# Shown as the stage of the job running in the thread that logged it
+class _FastF1Stages(logging.Handler):
+    def emit(self, record):
+        listener = _stage_listeners.get(record.thread)
+        if listener is not None and record.levelno >= logging.INFO:
+            listener(record.getMessage())
+
+
+_stage_handler = _FastF1Stages()
+
+
+# Load a session and draw its plots in a background thread. Read progress() and new_results()
+# while it runs, cancel() when the request is superseded: a load in progress still completes
+# (the session goes to the memory cache for the next request), but no more plots are drawn
+class LoadJob:
+    def __init__(self, key, label, session_spec, jobs):
+        self.key = key
+        self.label = label
+        self.session_spec = session_spec
+        self.jobs = jobs
+        self.session = None
+        # Warnings of the session load and timing spans of the job, complete once it is finished
+        self.events = []
+        self.spans = []
+        self._results = []
+        self._subscribers = 1
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._progress = {
+            "stage": "waiting", "loaded": False, "plots_done": [], "plots_total": len(jobs),
+            "finished": False, "cancelled": False, "error": None, "elapsed_s": 0.0,
+        }
+        self._start = time.perf_counter()
+
+    # Snapshot of the progress: stage, loaded, plots_done (figure names), plots_total,
+    # finished, cancelled, error, elapsed_s
+    def progress(self):
+        with self._lock:
+            progress = dict(self._progress)
+            progress["plots_done"] = list(progress["plots_done"])
+        if not progress["finished"]:
+            progress["elapsed_s"] = time.perf_counter() - self._start
+        return progress
+
+    # Plots drawn after the first start ones, as [(index, data, stats)] like render.render_plots()
+    def new_results(self, start=0):
+        with self._lock:
+            return self._results[start:]
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while not self.progress()["finished"]:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            time.sleep(0.05)
+        return self.progress()
+
+    # Drop one requester, the job stops once nobody is left waiting for it
+    def cancel(self):
+        with self._lock:
+            self._subscribers -= 1
+            if self._subscribers > 0 or self._progress["finished"]:
+                return
+        self._cancel.set()
+        logger.info("Cancelled %s", self.label)
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def _join(self):
+        with self._lock:
+            if self._progress["finished"] or self._cancel.is_set():
+                return False
+            self._subscribers += 1
+            return True
+
+    def _update(self, **values):
+        with self._lock:
+            self._progress.update(values)
+
+    # Profiled with F1_PROFILE: the loading and drawing happen in this thread, not in the one of the page
+    def run(self):
+        import f1_analysis
+        import render
+
+        spans = []
+        _stage_listeners[threading.get_ident()] = lambda stage: self._update(stage=stage)
+        try:
+            with timing.profile(self.label), timing.collect() as spans, timing.listen(lambda stage: self._update(stage=stage)):
+                with diagnostics.collect() as events:
+                    self.session = f1_analysis.load_session_cached(*self.session_spec)
+                self.events = events
+                self._update(loaded=self.session is not None)
+
+                if self.session is not None and not self.cancelled():
+                    results = render.render_plots(self.session, self.session_spec, self.jobs)
+                    for index, data, stats in results:
+                        with self._lock:
+                            self._results.append((index, data, stats))
+                            self._progress["plots_done"].append(stats["figure"])
+                        if self.cancelled():
+                            results.close()
+                            break
+        except Exception as e:
+            logger.exception("Could not load %s", self.label)
+            self._update(error=str(e))
+        finally:
+            del _stage_listeners[threading.get_ident()]
+            self.spans = spans
+            with _jobs_lock:
+                if _jobs.get(self.key) is self:
+                    del _jobs[self.key]
+            self._update(finished=True, cancelled=self.cancelled(), stage="done", elapsed_s=time.perf_counter() - self._start)
+            logger.info("%s %s in %.1f s", self.label, "cancelled" if self.cancelled() else "done", time.perf_counter() - self._start)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=LOAD_WORKERS, thread_name_prefix="load")
+            logging.getLogger("fastf1").addHandler(_stage_handler)
+        return _executor
+
+
+# Same session and same plots
+def _job_key(session_spec, jobs):
+    return json.dumps([session_spec, jobs], sort_keys=True, default=sorted)
+
+
+# Start loading session_spec (the load_session_cached arguments) and drawing jobs, [(plot_name, args, name)]
+# as for render.render_plots(). A request identical to one still running shares its job.
+# current is the job the requester already waits for: asking again for it doesn't count twice
+def submit(session_spec, jobs, label="", current=None):
+    key = _job_key(session_spec, jobs)
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is not None and job is current and not job.cancelled():
+            return job
+        if job is not None and job._join():
+            logger.info("%s joins the running request", label)
+            return job
+
+        job = LoadJob(key, label, session_spec, jobs)
+        _jobs[key] = job
+    _get_executor().submit(job.run)
+    return job
+
@@ -0,0 +1,197 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import diagnostics
+import session_cache
+
+logger = logging.getLogger(__name__)
+
+# Sessions loaded when the app starts, e.g. "2024:Monaco:Qualifying,2024:Monaco:Race"
+PREWARM_SESSIONS = os.environ.get("F1_PREWARM", "")
+# Also load these session types of the latest N events of the schedule (0 = none)
+PREWARM_LATEST = int(os.environ.get("F1_PREWARM_LATEST", "0"))
+PREWARM_SESSION_TYPES = [name.strip() for name in os.environ.get("F1_PREWARM_SESSION_TYPES", "Qualifying,Race").split(",") if name.strip()]
+# Sessions loaded at the same time
+PREWARM_WORKERS = int(os.environ.get("F1_PREWARM_WORKERS", "2"))
+
+
+# "2024:Monaco:Qualifying,2024:Las Vegas:Race" -> [(2024, "Monaco", "Qualifying"), (2024, "Las Vegas", "Race")]
+def parse_sessions(text):
+    sessions = []
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        year, grand_prix, session_type = (part.strip() for part in item.split(":"))
+        sessions.append((int(year), grand_prix, session_type))
+    return sessions
+
+
+# session_types of the latest n events that already took place, most recent first.
+# Uses the fastf1 event schedule, which comes from the cache in offline mode
+def latest_sessions(n, session_types, now=None):
+    import fastf1
+    import pandas as pd
+    import f1_analysis
+
+    session_cache.ensure_cache()
+    now = now or pd.Timestamp.now(tz="UTC").tz_localize(None)
+
+    sessions = []
+    events_found = 0
+    year = now.year
+    # Early in the season the latest events are in the previous year
+    while events_found < n and year >= now.year - 1:
+        schedule = fastf1.get_event_schedule(year, include_testing=False)
+        past = schedule[schedule["EventDate"] <= now].sort_values("EventDate", ascending=False)
+
+        for _, event in past.head(n - events_found).iterrows():
+            events_found += 1
+            for session_type in session_types:
+                name = f1_analysis.SESSION_NAMES[session_type]
+                for i in range(1, 6):
+                    # Only sessions held at this event and already over
+                    session_date = event.get(f"Session{i}DateUtc")
+                    if event.get(f"Session{i}") == name and pd.notna(session_date) and session_date <= now:
+                        sessions.append((year, event["Location"], session_type))
+        year -= 1
+
+    return sessions
+
+
+# Loads a list of sessions into the disk and memory caches in a background thread,
+# at most workers at a time. Read progress() to follow it
+class Prewarmer:
+    def __init__(self, sessions=(), latest=0, session_types=None, workers=None):
+        self.sessions = list(sessions)
+        self.latest = latest
+        self.session_types = session_types or PREWARM_SESSION_TYPES
+        self.workers = max(1, workers or PREWARM_WORKERS)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._progress = {
+            "total": len(self.sessions), "done": 0, "loaded": 0, "failed": 0,
+            "running": [], "errors": [], "finished": False, "elapsed_s": 0.0,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="prewarm-sessions", daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.progress()
+
+    # Snapshot of the progress: total, done, loaded, failed, running, errors, finished, elapsed_s
+    def progress(self):
+        with self._lock:
+            progress = dict(self._progress)
+            progress["running"] = list(progress["running"])
+            progress["errors"] = list(progress["errors"])
+        return progress
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            if self.latest:
+                try:
+                    latest = latest_sessions(self.latest, self.session_types)
+                except Exception as e:
+                    logger.warning("Could not read the event schedule: %s", e)
+                    self._update(errors=[f"event schedule: {e}"])
+                    latest = []
+                # Explicit sessions first, without loading anything twice
+                self.sessions += [session for session in latest if session not in self.sessions]
+                self._update(total=len(self.sessions))
+
+            logger.info("Prewarming %d sessions, %d at a time", len(self.sessions), self.workers)
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prewarm") as pool:
+                futures = {pool.submit(self._load, *session): session for session in self.sessions}
+                for future in as_completed(futures):
+                    future.result()
+        finally:
+            self._update(finished=True, elapsed_s=time.perf_counter() - start)
+            progress = self.progress()
+            logger.info("Prewarm done: %d loaded, %d failed in %.1f s", progress["loaded"], progress["failed"], progress["elapsed_s"])
+
+    def _load(self, year, grand_prix, session_type):
+        import f1_analysis
+        import render
+
+        label = f"{year} {grand_prix} {session_type}"
+        with self._lock:
+            self._progress["running"].append(label)
+
+        # Same data and cache key as a request for the session from the form
+        plots = render.SESSION_PLOTS.get(session_type, [])
+        requirements = f1_analysis.plot_requirements([getattr(f1_analysis, plot_name) for _, plot_name, _, _ in plots])
+
+        session = None
+        with diagnostics.collect() as events:
+            try:
+                session = f1_analysis.load_session_cached("Grand Prix", year, grand_prix, session_type, requirements)
+            except Exception as e:
+                diagnostics.warn(str(e))
+
+        with self._lock:
+            self._progress["running"].remove(label)
+            self._progress["done"] += 1
+            if session is None:
+                self._progress["failed"] += 1
+                reason = "; ".join(diagnostics.plain_messages(events)) or "not available"
+                self._progress["errors"].append(f"{label}: {reason}")
+            else:
+                self._progress["loaded"] += 1
+            done, total = self._progress["done"], self._progress["total"]
+
+        logger.info("Prewarm %d/%d %s: %s", done, total, label, "loaded" if session is not None else "failed")
+
+    def _update(self, errors=(), **values):
+        with self._lock:
+            self._progress.update(values)
+            self._progress["errors"].extend(errors)
+
+
+# Prewarmer for the F1_PREWARM* settings, already started, or None if nothing is configured
+def start_from_env():
+    sessions = parse_sessions(PREWARM_SESSIONS)
+    if not sessions and not PREWARM_LATEST:
+        return None
+    return Prewarmer(sessions, PREWARM_LATEST, PREWARM_SESSION_TYPES, PREWARM_WORKERS).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load sessions into the cache ahead of the first users.")
+    parser.add_argument("sessions", nargs="*", metavar="YEAR:GP:SESSION", help="sessions to load, e.g. 2024:Monaco:Qualifying")
+    parser.add_argument("--latest", type=int, default=0, help="also load the latest N events of the schedule")
+    parser.add_argument("--session-types", nargs="+", default=PREWARM_SESSION_TYPES, metavar="SESSION",
+                        help="session types loaded for --latest (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=PREWARM_WORKERS, help="sessions loaded at the same time")
+    parser.add_argument("--cache-dir", help="fastf1 cache folder")
+    parser.add_argument("--offline", action="store_true", help="only use the local cache, without network access")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    session_cache.configure_cache(args.cache_dir, offline=args.offline or None)
+
+    prewarmer = Prewarmer(parse_sessions(",".join(args.sessions)), args.latest, args.session_types, args.workers).start()
+    while True:
+        progress = prewarmer.wait(timeout=2)
+        if progress["finished"]:
+            break
+        print(f"{progress['done']}/{progress['total']} sessions, loading {', '.join(progress['running']) or '-'}")
+
+    for error in progress["errors"]:
+        print(f"failed: {error}")
+    print(f"{progress['loaded']} sessions loaded, {progress['failed']} failed in {progress['elapsed_s']:.1f} s")
+    return 1 if progress["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
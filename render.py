@@ -0,0 +1,322 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import f1_analysis
+import diagnostics
+import figure_cache
+import figures
+import session_cache
+import timing
+
+logger = logging.getLogger(__name__)
+
+# Worker processes used to draw figures, 0 or 1 draws them in the calling thread
+RENDER_WORKERS = int(os.environ.get("F1_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Sessions kept in the memory cache of every worker, on top of the ones of the app process
+WORKER_SESSIONS = 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Plots drawn in this process share matplotlib's rcParams, draw them one at a time
+_plot_lock = threading.Lock()
+
+# Extra arguments of the plot functions, after the session
+NO_ARGS = "none"
+DRIVER_PAIR = "driver_pair"       # (driver1, driver2)
+MINI_SECTORS = "mini_sectors"     # (driver1, driver2, n_minisectors)
+DRIVER_LIST = "driver_list"       # ([driver1, driver2], TEAM_COLORS)
+COLORS = "colors"                 # (TEAM_COLORS,)
+DRIVER_GROUP = "driver_group"     # (drivers,)
+GROUP_MINI_SECTORS = "group_mini_sectors"   # (drivers, n_minisectors)
+
+# Plots comparing a group of drivers, only drawn when the group is larger than the pair
+GROUP_ARGS = {DRIVER_GROUP, GROUP_MINI_SECTORS}
+
+# Plots shown for each session type: (title, plot function name, arguments, file name)
+SESSION_PLOTS = {
+    "Qualifying": [
+        ('⏱️ Session Ranking', 'plot_session_ranking', NO_ARGS, 'session_ranking_Q'),
+        ('🏎️ Best Lap Per Team', 'plot_best_laps', NO_ARGS, 'best_lap_per_team_Q'),
+        ('📈 Lap Time Comparison', 'plot_lap_comparison', DRIVER_PAIR, 'lap_time_comparison_Q'),
+        ('🏁 Track Dominance', 'plot_track_dominance', MINI_SECTORS, 'track_dominance_Q'),
+        ('🚀 Max Speeds vs Lap Time', 'plot_max_speeds', NO_ARGS, 'max_speeds_vs_laptime_Q'),
+        ('👥 Multi-Driver Lap Comparison', 'plot_multi_lap_comparison', DRIVER_GROUP, 'multi_lap_comparison_Q'),
+        ('🗺️ Multi-Driver Track Dominance', 'plot_multi_track_dominance', GROUP_MINI_SECTORS, 'multi_track_dominance_Q'),
+    ],
+    "Sprint Qualifying": [
+        ('⏱️ Session Ranking', 'plot_session_ranking', NO_ARGS, 'session_ranking_SQ'),
+        ('🏎️ Best Lap Per Team', 'plot_best_laps', NO_ARGS, 'best_lap_per_team_SQ'),
+        ('📈 Lap Time Comparison', 'plot_lap_comparison', DRIVER_PAIR, 'lap_time_comparison_SQ'),
+        ('🏁 Track Dominance', 'plot_track_dominance', MINI_SECTORS, 'track_dominance_SQ'),
+        ('🚀 Max Speeds vs Lap Time', 'plot_max_speeds', NO_ARGS, 'max_speeds_vs_laptime_SQ'),
+        ('👥 Multi-Driver Lap Comparison', 'plot_multi_lap_comparison', DRIVER_GROUP, 'multi_lap_comparison_SQ'),
+        ('🗺️ Multi-Driver Track Dominance', 'plot_multi_track_dominance', GROUP_MINI_SECTORS, 'multi_track_dominance_SQ'),
+    ],
+    "Race": [
+        ('📋 Final Race Classification', 'plot_race_ranking_table', NO_ARGS, 'final_race_classification_R'),
+        ('🏁 Stint Comparison', 'plot_stint_comparison', DRIVER_LIST, 'stint_comparison_R'),
+        ('📊 Lap Time Distribution', 'plot_lap_time_distribution', COLORS, 'lap_time_distribution_R'),
+        ('⛽ Race Pace', 'plot_race_pace', DRIVER_LIST, 'race_pace_R'),
+    ],
+    "Sprint Race": [
+        ('📋 Final Race Classification', 'plot_race_ranking_table', NO_ARGS, 'final_race_classification_SR'),
+        ('🏁 Stint Comparison', 'plot_stint_comparison', DRIVER_LIST, 'stint_comparison_SR'),
+        ('📊 Lap Time Distribution', 'plot_lap_time_distribution', COLORS, 'lap_time_distribution_SR'),
+        ('⛽ Race Pace', 'plot_race_pace', DRIVER_LIST, 'race_pace_SR'),
+    ],
+}
+
+# Same plots for the three practice sessions
+SESSION_PLOTS["FP1"] = SESSION_PLOTS["FP2"] = SESSION_PLOTS["FP3"] = [
+    ('⏱️ Practice Session Ranking', 'plot_free_practice_ranking', NO_ARGS, 'session_ranking_FP'),
+    ('🏎️ Best Lap Per Team', 'plot_best_laps', NO_ARGS, 'best_lap_per_team_FP'),
+    ('📊 Lap Time Distribution', 'plot_lap_time_distribution', COLORS, 'lap_time_distribution_FP'),
+    ('🚀 Max Speeds vs Lap Time', 'plot_max_speeds', NO_ARGS, 'max_speeds_vs_laptime_FP'),
+    ('🏁 Track Dominance', 'plot_track_dominance', MINI_SECTORS, 'track_dominance_FP'),
+    ('📈 Lap Time Comparison', 'plot_lap_comparison', DRIVER_PAIR, 'lap_time_comparison_FP'),
+    ('👥 Multi-Driver Lap Comparison', 'plot_multi_lap_comparison', DRIVER_GROUP, 'multi_lap_comparison_FP'),
+    ('🗺️ Multi-Driver Track Dominance', 'plot_multi_track_dominance', GROUP_MINI_SECTORS, 'multi_track_dominance_FP'),
+]
+
+
+# Build the arguments passed to a plot function after the session.
+# drivers is the group of the multi-driver plots, None means the whole grid
+def plot_args(arg_kind, driver1, driver2, n_minisectors=25, drivers=None):
+    if arg_kind == DRIVER_PAIR:
+        return (driver1, driver2)
+    if arg_kind == MINI_SECTORS:
+        return (driver1, driver2, n_minisectors)
+    if arg_kind == DRIVER_LIST:
+        return ([driver1, driver2], f1_analysis.TEAM_COLORS)
+    if arg_kind == COLORS:
+        return (f1_analysis.TEAM_COLORS,)
+    if arg_kind == DRIVER_GROUP:
+        return (drivers,)
+    if arg_kind == GROUP_MINI_SECTORS:
+        return (drivers, n_minisectors)
+    return ()
+
+
+# Encode a figure once with a render profile, returning the bytes and how long it took
+def encode_figure(fig, profile=None, name=""):
+    profile = profile or f1_analysis.DEFAULT_PROFILE
+
+    start = time.perf_counter()
+    data = f1_analysis.figure_bytes(fig, profile)
+    stats = {
+        "figure": name,
+        "profile": profile,
+        "format": f1_analysis.RENDER_PROFILES[profile]["format"],
+        "encode_s": time.perf_counter() - start,
+        "size_bytes": len(data),
+        "cache_hit": False,
+        "events": [],
+    }
+
+    logger.info("Encoded %s (%s) in %.3f s, %.1f KB", name or "figure", profile, stats["encode_s"], len(data) / 1024)
+    return data, stats
+
+
+# Identity of a loaded session, stable across processes
+def session_id(session):
+    return session.api_path
+
+
+def _cache_key(session, plot_name, args, profile):
+    settings = f1_analysis.RENDER_PROFILES[profile]
+    key = figure_cache.figure_key(session_id(session), plot_name, args, settings, f1_analysis.plot_settings())
+    return key, settings["format"]
+
+
+# Bytes of a plot from the figure cache, or (None, None) if it was never drawn
+def cached_plot(session, plot_name, args=(), profile=None, name=""):
+    profile = profile or f1_analysis.DEFAULT_PROFILE
+    key, file_format = _cache_key(session, plot_name, args, profile)
+
+    start = time.perf_counter()
+    data = figure_cache.get(key, file_format)
+    if data is None:
+        return None, None
+
+    stats = {
+        "figure": name or plot_name,
+        "profile": profile,
+        "format": file_format,
+        "encode_s": time.perf_counter() - start,
+        "size_bytes": len(data),
+        "cache_hit": True,
+        "events": [],
+    }
+    return data, stats
+
+
+# Rendered bytes of a plot, served from the figure cache when the same plot was drawn before.
+# stats["events"] holds the warnings raised while drawing (see diagnostics).
+# data is None if the plot has nothing to show, stats then only carries the events.
+# With use_cache=False the plot is always drawn and the figure cache is neither read nor written
+def render_plot(session, plot_name, args=(), profile=None, name="", use_cache=True):
+    profile = profile or f1_analysis.DEFAULT_PROFILE
+
+    if use_cache:
+        data, stats = cached_plot(session, plot_name, args, profile, name)
+        if data is not None:
+            return data, stats
+
+    plot_func = getattr(f1_analysis, plot_name)
+
+    data = None
+    with diagnostics.collect() as events:
+        # Only now load telemetry etc. if the plot needs it
+        f1_analysis.ensure_session_data(session, plot_func.requirements)
+
+        # Figures are closed as soon as they are encoded, only the bytes are kept
+        with _plot_lock, figures.closing(plot_func(session, *args, profile=profile)) as fig:
+            if fig is not None:
+                data, stats = encode_figure(fig, profile, name or plot_name)
+
+    if data is None:
+        return None, {"figure": name or plot_name, "events": events}
+
+    stats["events"] = events
+    # The cache only keeps bytes, figures drawn with warnings are drawn again so the warnings are shown again
+    if use_cache and not events:
+        key, file_format = _cache_key(session, plot_name, args, profile)
+        figure_cache.put(key, file_format, data)
+    return data, stats
+
+
+'''------------------------------------------------------------------------------------'''
+
+'''PARALLEL RENDERING'''
+
+# Settings of the parent process, applied in every worker.
+# Every worker loads the sessions it draws again, from the disk cache, into its own memory cache:
+# with the F1_SESSION_MEMORY_MB budget each, N workers could hold N times the sessions of the app.
+# A worker only keeps its latest session, so the pool costs at most one session per worker
+def _init_worker(cache_dir, cache_max_mb, offline, figure_cache_dir, figure_cache_max_mb):
+    session_cache.configure_cache(cache_dir, cache_max_mb, offline)
+    figure_cache.configure_figure_cache(figure_cache_dir, figure_cache_max_mb)
+    session_cache.SESSIONS.max_sessions = WORKER_SESSIONS
+
+
+# Runs in a worker: load the session (from the disk cache, then the worker's memory cache) and draw
+# a batch of plots, returning [(index, data, stats)]. Warnings travel back in stats["events"],
+# the timing spans of the whole batch in stats["spans"] of the first result
+def _render_in_worker(session_spec, batch, profile):
+    with timing.collect() as spans:
+        with diagnostics.collect() as events:
+            session = f1_analysis.load_session_cached(*session_spec)
+        if session is None:
+            results = [(index, None, {"figure": name, "events": events}) for index, _, _, name in batch]
+        else:
+            results = [(index, *render_plot(session, plot_name, args, profile, name)) for index, plot_name, args, name in batch]
+
+    results[0][2]["spans"] = spans
+    figures.memory_report(f"Worker {os.getpid()} after {len(batch)} figures")
+    return results
+
+
+# Split plots into worker batches. Plots reading telemetry go together, so they share
+# the fastest lap telemetry computed by the first one
+def _batches(jobs, indexes):
+    batches = []
+    telemetry_batch = []
+    for index in indexes:
+        plot_name, args, name = jobs[index]
+        if f1_analysis.TELEMETRY in getattr(f1_analysis, plot_name).requirements:
+            telemetry_batch.append((index, plot_name, args, name))
+        else:
+            batches.append([(index, plot_name, args, name)])
+
+    if telemetry_batch:
+        # Telemetry plots are the slowest ones, start them first
+        batches.insert(0, telemetry_batch)
+    return batches
+
+
+# Process pool shared by every request, created on first use
+def get_pool(workers=None):
+    global _pool
+    workers = workers or RENDER_WORKERS
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = new_pool(workers)
+        return _pool
+
+
+# New process pool whose workers use the cache settings of this process.
+# With max_tasks_per_child, workers are replaced after that many tasks to give their memory back
+def new_pool(workers, max_tasks_per_child=None):
+    # Spawned workers don't inherit the locks and threads of the Streamlit server
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=max_tasks_per_child,
+        initializer=_init_worker,
+        initargs=(
+            session_cache.CACHE_DIR, session_cache.CACHE_MAX_MB, session_cache.OFFLINE,
+            figure_cache.FIGURE_CACHE_DIR, figure_cache.FIGURE_CACHE_MAX_MB,
+        ),
+    )
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+# Render the plots of a session concurrently, yielding (index, data, stats) as soon as each one is ready.
+# jobs is a list of (plot_name, args, name); session_spec holds the load_session_cached arguments
+# the workers use to get their own copy of the session
+def render_plots(session, session_spec, jobs, profile=None, workers=None):
+    workers = RENDER_WORKERS if workers is None else workers
+
+    # Cached figures don't need any drawing, hand them out first
+    pending = []
+    for index, (plot_name, args, name) in enumerate(jobs):
+        data, stats = cached_plot(session, plot_name, args, profile, name)
+        if data is not None:
+            yield index, data, stats
+        else:
+            pending.append(index)
+
+    if workers <= 1 or len(pending) <= 1:
+        for index in pending:
+            plot_name, args, name = jobs[index]
+            yield (index, *render_plot(session, plot_name, args, profile, name))
+        return
+
+    pool = get_pool(workers)
+    futures = {}
+    for batch in _batches(jobs, pending):
+        futures[pool.submit(_render_in_worker, session_spec, batch, profile)] = batch
+
+    try:
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception:
+                # A crashed worker should not cost the user the plots
+                logger.exception("Worker failed to render %s, drawing them here", [job[1] for job in futures[future]])
+                results = [
+                    (index, *render_plot(session, plot_name, args, profile, name))
+                    for index, plot_name, args, name in futures[future]
+                ]
+            # The spans of workers count for the request of this thread
+            for _, _, stats in results:
+                timing.record(stats.pop("spans", None))
+            yield from results
+    finally:
+        # Closed early (a cancelled request): batches not started yet don't hold the workers
+        # for the next request. A batch already running in a worker still finishes
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,322 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+import numpy as np
+import pandas as pd
+from matplotlib.ticker import MaxNLocator
+import f1_analysis
+import diagnostics
+import render
+import session_cache
+import batch
+import figures
+import timing
+
+logger = logging.getLogger(__name__)
+
+# Session types whose pace is the median fuel corrected green flag lap, the others use the best lap
+RACE_SESSION_TYPES = ["Race", "Sprint Race"]
+
+# Worker processes are replaced after this many sessions, so fastf1 data can't pile up in them
+SESSIONS_PER_WORKER = 4
+
+# Columns of the accumulated pace table, one row per driver and session
+PACE_COLUMNS = ["Year", "Round", "GrandPrix", "SessionType", "Driver", "Team", "Pace"]
+SESSION_KEY = ["Year", "Round", "GrandPrix", "SessionType"]
+
+
+'''------------------------------------------------------------------------------------'''
+
+'''SESSION RECORDS'''
+
+# Pace of every driver of a loaded session as [(driver, team, pace_s)]:
+# the best lap, or for races the median fuel corrected green flag lap
+def driver_pace(session, session_type):
+    if session_type in RACE_SESSION_TYPES:
+        laps = f1_analysis.race_pace(session)["laps"]
+        laps = laps[laps["Valid"]]
+        pace = laps.groupby("Driver").agg(Team=("Team", "first"), Pace=("FuelCorrected", "median"))
+    else:
+        pace = f1_analysis.session_summary(session)["drivers"].set_index("Driver").rename(columns={"LapTime": "Pace"})
+    return [(driver, team, float(value)) for driver, team, value in zip(pace.index, pace["Team"], pace["Pace"])]
+
+
+# Runs in a worker: load one session and reduce it to a small record, the session is dropped right after.
+# drivers is None when the session is not available
+def session_record(year, grand_prix, session_type):
+    with diagnostics.collect() as events:
+        session = f1_analysis.load_session("Grand Prix", year, grand_prix, session_type, {f1_analysis.LAPS})
+
+    record = {"year": year, "grand_prix": grand_prix, "session_type": session_type, "round": 0, "drivers": None}
+    if session is not None:
+        record["round"] = int(session.event["RoundNumber"])
+        record["drivers"] = driver_pace(session, session_type)
+    record["warnings"] = diagnostics.plain_messages(events)
+    return record
+
+
+'''------------------------------------------------------------------------------------'''
+
+'''ACCUMULATOR'''
+
+# Season state built one session record at a time: a row of plain values per driver and session.
+# A season of 24 events is a few thousand rows, whatever the number of sessions loaded
+class SeasonAccumulator:
+    def __init__(self):
+        self.rows = []
+        self.sessions = 0
+        self.unavailable = []
+        self.warnings = []
+
+    def add(self, record):
+        label = f"{record['year']} {record['grand_prix']} {record['session_type']}"
+        self.warnings.extend(f"{label}: {warning}" for warning in record["warnings"])
+        if record["drivers"] is None:
+            self.unavailable.append(label)
+            return
+
+        self.sessions += 1
+        for driver, team, pace in record["drivers"]:
+            self.rows.append((record["year"], record["round"], record["grand_prix"], record["session_type"], driver, team, pace))
+
+    # All rows as a DataFrame with PACE_COLUMNS, in calendar order
+    def table(self):
+        table = pd.DataFrame(self.rows, columns=PACE_COLUMNS)
+        return table.sort_values(SESSION_KEY + ["Pace"], kind="stable").reset_index(drop=True)
+
+
+'''------------------------------------------------------------------------------------'''
+
+'''SEASON VIEWS'''
+
+# Gap between the two fastest drivers of every team in every session, in seconds and percent.
+# Each pair keeps the same orientation all season: Driver is the alphabetically first, Gap > 0 means slower
+def teammate_gaps(table):
+    ranked = table.dropna(subset=["Pace"]).sort_values(SESSION_KEY + ["Team", "Pace"], kind="stable")
+    rank = ranked.groupby(SESSION_KEY + ["Team"]).cumcount()
+    first = ranked[rank == 0].set_index(SESSION_KEY + ["Team"])[["Driver", "Pace"]]
+    second = ranked[rank == 1].set_index(SESSION_KEY + ["Team"])[["Driver", "Pace"]]
+    pairs = first.join(second, rsuffix="Teammate", how="inner").reset_index()
+
+    swap = (pairs["Driver"] > pairs["DriverTeammate"]).to_numpy()
+    driver = np.where(swap, pairs["DriverTeammate"], pairs["Driver"])
+    teammate = np.where(swap, pairs["Driver"], pairs["DriverTeammate"])
+    pace = np.where(swap, pairs["PaceTeammate"], pairs["Pace"])
+    teammate_pace = np.where(swap, pairs["Pace"], pairs["PaceTeammate"])
+
+    gaps = pairs[SESSION_KEY + ["Team"]].copy()
+    gaps["Driver"] = driver
+    gaps["Teammate"] = teammate
+    gaps["Gap"] = pace - teammate_pace
+    gaps["GapPct"] = gaps["Gap"] / teammate_pace * 100
+    return gaps
+
+# Head to head of every teammate pair over the season: Sessions, Ahead (sessions Driver was faster),
+# MedianGap and MedianGapPct
+def teammate_summary(gaps):
+    return gaps.groupby(["Team", "Driver", "Teammate"], as_index=False).agg(
+        Sessions=("Gap", "size"),
+        Ahead=("Gap", lambda gap: int((gap < 0).sum())),
+        MedianGap=("Gap", "median"),
+        MedianGapPct=("GapPct", "median"),
+    ).sort_values("MedianGapPct", kind="stable").reset_index(drop=True)
+
+# Pace of every team in every session (its fastest driver) and its Delta to the fastest team, in seconds and percent
+def team_pace(table):
+    teams = table.dropna(subset=["Pace"]).groupby(SESSION_KEY + ["Team"], as_index=False)["Pace"].min()
+    best = teams.groupby(SESSION_KEY)["Pace"].transform("min")
+    teams["Delta"] = teams["Pace"] - best
+    teams["DeltaPct"] = teams["Delta"] / best * 100
+    return teams
+
+# Average Delta of every team over the season, fastest first
+def team_summary(pace):
+    return pace.groupby("Team", as_index=False).agg(
+        Sessions=("Delta", "size"),
+        MeanDelta=("Delta", "mean"),
+        MeanDeltaPct=("DeltaPct", "mean"),
+    ).sort_values("MeanDeltaPct", kind="stable").reset_index(drop=True)
+
+
+# x axis of the season plots: one tick per session in calendar order
+def _session_axis(table):
+    sessions = table[SESSION_KEY].drop_duplicates().sort_values(SESSION_KEY, kind="stable").reset_index(drop=True)
+    positions = {tuple(row): i for i, row in enumerate(sessions.itertuples(index=False))}
+    labels = [grand_prix if len(sessions["SessionType"].unique()) == 1 else f"{grand_prix} {session_type}"
+              for grand_prix, session_type in zip(sessions["GrandPrix"], sessions["SessionType"])]
+    return [positions[key] for key in zip(*(table[column] for column in SESSION_KEY))], labels
+
+# Season plot: teammate gap of every pair, session after session
+@timing.timed()
+@f1_analysis.dark_style
+def plot_teammate_gaps(gaps, title, profile=None):
+    fig = figures.new_figure(figsize=(16, 9), dpi=f1_analysis.profile_dpi(profile))
+    ax = fig.subplots()
+
+    positions, labels = _session_axis(gaps)
+    gaps = gaps.assign(Position=positions)
+    for (team, driver, teammate), pair in gaps.groupby(["Team", "Driver", "Teammate"], sort=False):
+        ax.plot(pair["Position"], pair["GapPct"], marker="o", markersize=4, linewidth=1.5,
+                color=f1_analysis.TEAM_COLORS.get(team, "gray"), label=f"{driver} vs {teammate}")
+
+    ax.axhline(0, color="gray", linestyle="--", alpha=0.7)
+    ax.set_xticks(range(len(labels)), labels, rotation=45, ha="right")
+    ax.set_ylabel("Gap to Teammate (%)")
+    ax.set_title(f"{title}\nTeammate Gaps (> 0: first driver slower)", fontsize=14)
+    ax.legend(fontsize=8, ncol=2)
+    ax.grid(True, linestyle="--", alpha=0.5)
+    fig.tight_layout()
+
+    return fig
+
+# Season plot: delta of every team to the fastest one, session after session
+@timing.timed()
+@f1_analysis.dark_style
+def plot_team_pace(pace, title, profile=None):
+    fig = figures.new_figure(figsize=(16, 9), dpi=f1_analysis.profile_dpi(profile))
+    ax = fig.subplots()
+
+    positions, labels = _session_axis(pace)
+    pace = pace.assign(Position=positions)
+    for team, team_rows in pace.groupby("Team", sort=False):
+        ax.plot(team_rows["Position"], team_rows["DeltaPct"], marker="o", markersize=4, linewidth=1.5,
+                color=f1_analysis.TEAM_COLORS.get(team, "gray"), label=team)
+
+    ax.set_xticks(range(len(labels)), labels, rotation=45, ha="right")
+    ax.yaxis.set_major_locator(MaxNLocator(nbins=10))
+    ax.invert_yaxis()
+    ax.set_ylabel("Delta to the Fastest Team (%)")
+    ax.set_title(f"{title}\nTeam Pace", fontsize=14)
+    ax.legend(fontsize=8, ncol=2)
+    ax.grid(True, linestyle="--", alpha=0.5)
+    fig.tight_layout()
+
+    return fig
+
+
+'''------------------------------------------------------------------------------------'''
+
+'''ENGINE'''
+
+# (year, grand_prix, session_type) of every selected session, in calendar order
+def season_sessions(years, session_types, grands_prix=None):
+    return [(year, grand_prix, session_type)
+            for year in years
+            for grand_prix in grands_prix or batch.season_grands_prix(year)
+            for session_type in session_types]
+
+
+def _failed_record(spec, error):
+    year, grand_prix, session_type = spec
+    return {"year": year, "grand_prix": grand_prix, "session_type": session_type, "round": 0,
+            "drivers": None, "warnings": [str(error)]}
+
+# Load sessions and fold each one into an accumulator as soon as it is ready.
+# At most two sessions per worker are in flight, so neither sessions nor pending results pile up.
+# on_record(done, record) is called after every session
+def run_season(sessions, workers=None, accumulator=None, on_record=None):
+    accumulator = accumulator or SeasonAccumulator()
+    workers = render.RENDER_WORKERS if workers is None else workers
+    done = 0
+
+    def fold(record):
+        nonlocal done
+        done += 1
+        accumulator.add(record)
+        if on_record is not None:
+            on_record(done, record)
+
+    if workers <= 1 or len(sessions) <= 1:
+        for spec in sessions:
+            try:
+                fold(session_record(*spec))
+            except Exception as e:
+                logger.exception("Could not process %s", spec)
+                fold(_failed_record(spec, e))
+        return accumulator
+
+    def fold_future(future):
+        try:
+            fold(future.result())
+        except Exception as e:
+            fold(_failed_record(pending[future], e))
+
+    pool = render.new_pool(min(workers, len(sessions)), max_tasks_per_child=SESSIONS_PER_WORKER)
+    pending = {}
+    try:
+        for spec in sessions:
+            pending[pool.submit(session_record, *spec)] = spec
+            if len(pending) >= workers * 2:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    fold_future(future)
+                    del pending[future]
+        for future in as_completed(list(pending)):
+            fold_future(future)
+            del pending[future]
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+    return accumulator
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Season-wide teammate gaps and team pace over many sessions.")
+    parser.add_argument("--years", nargs="+", required=True, help="years or ranges, e.g. 2024 or 2022-2024")
+    parser.add_argument("--gp", nargs="+", dest="grands_prix", help="Grand Prix names (default: every event of the season)")
+    parser.add_argument("--sessions", nargs="+", default=["Qualifying"], choices=batch.SESSION_TYPES, metavar="SESSION",
+                        help="session types (default: Qualifying)")
+    parser.add_argument("--out", default="season", help="output folder (default: ./season)")
+    parser.add_argument("--profile", default=f1_analysis.DEFAULT_PROFILE, choices=list(f1_analysis.RENDER_PROFILES),
+                        help="render profile of the figures")
+    parser.add_argument("--workers", type=int, default=render.RENDER_WORKERS, help="sessions loaded at the same time")
+    parser.add_argument("--cache-dir", help="fastf1 cache folder")
+    parser.add_argument("--offline", action="store_true", help="only use sessions already in the cache")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    session_cache.configure_cache(args.cache_dir, offline=args.offline or None)
+
+    start = time.perf_counter()
+    sessions = season_sessions(batch.parse_years(args.years), args.sessions, args.grands_prix)
+    print(f"{len(sessions)} sessions to process")
+
+    def report(done, record):
+        status = "not available" if record["drivers"] is None else f"{len(record['drivers'])} drivers"
+        print(f"[{done}/{len(sessions)}] {record['year']} {record['grand_prix']} {record['session_type']}: {status}")
+
+    accumulator = run_season(sessions, args.workers, on_record=report)
+    table = accumulator.table()
+    if table.empty:
+        print("No session available")
+        return 1
+
+    os.makedirs(args.out, exist_ok=True)
+    gaps = teammate_gaps(table)
+    pace = team_pace(table)
+    tables = {
+        "pace": table,
+        "teammate_gaps": gaps,
+        "teammate_summary": teammate_summary(gaps),
+        "team_pace": pace,
+        "team_summary": team_summary(pace),
+    }
+    for name, frame in tables.items():
+        frame.to_csv(os.path.join(args.out, f"{name}.csv"), index=False)
+
+    title = f"{', '.join(str(year) for year in batch.parse_years(args.years))} {', '.join(args.sessions)}"
+    file_format = f1_analysis.RENDER_PROFILES[args.profile]["format"]
+    for name, fig in (("teammate_gaps", plot_teammate_gaps(gaps, title, args.profile)), ("team_pace", plot_team_pace(pace, title, args.profile))):
+        with figures.closing(fig), open(os.path.join(args.out, f"{name}.{file_format}"), "wb") as f:
+            f.write(f1_analysis.figure_bytes(fig, args.profile))
+
+    print(tables["team_summary"].to_string(index=False))
+    print(f"{accumulator.sessions} sessions in {time.perf_counter() - start:.1f} s, {len(accumulator.unavailable)} not available; written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
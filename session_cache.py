@@ -0,0 +1,322 @@
+import os
+import shutil
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Cache settings, can be overridden from the environment or with configure_cache()
+CACHE_DIR = os.environ.get("F1_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+CACHE_MAX_MB = int(os.environ.get("F1_CACHE_MAX_MB", "4096"))
+OFFLINE = os.environ.get("F1_OFFLINE", "0").lower() in ("1", "true", "yes")
+SESSION_MEMORY_MB = int(os.environ.get("F1_SESSION_MEMORY_MB", "1024"))
+
+_lock = threading.Lock()
+_configured = False
+
+# Disk cache counters, read them with get_cache_stats()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "evicted_bytes": 0}
+
+
+# Point fastf1 to our cache directory (call again to change the settings)
+def configure_cache(cache_dir=None, max_mb=None, offline=None):
+    global CACHE_DIR, CACHE_MAX_MB, OFFLINE, _configured
+    # Imported here, fastf1 is slow to import and only needed once sessions are loaded
+    import fastf1
+
+    with _lock:
+        if cache_dir is not None:
+            CACHE_DIR = cache_dir
+        if max_mb is not None:
+            CACHE_MAX_MB = int(max_mb)
+        if offline is not None:
+            OFFLINE = bool(offline)
+
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fastf1.Cache.enable_cache(CACHE_DIR)
+        fastf1.Cache.offline_mode(OFFLINE)
+        _configured = True
+
+    logger.info("fastf1 cache at %s (cap %d MB, offline=%s)", CACHE_DIR, CACHE_MAX_MB, OFFLINE)
+
+
+# Configure the cache with the current settings if nobody did it yet
+def ensure_cache():
+    if not _configured:
+        configure_cache()
+
+
+# Directory where fastf1 stores the parsed data of a session
+def session_cache_path(session):
+    # fastf1 drops the leading '/static/' of the api path
+    return os.path.join(CACHE_DIR, session.api_path[len("/static/"):])
+
+
+# True if the parsed data of the session is already on disk
+def is_cached(session):
+    path = session_cache_path(session)
+    if not os.path.isdir(path):
+        return False
+    return any(name.endswith(".ff1pkl") for name in os.listdir(path))
+
+
+# Load a session through the disk cache, keeping hit/miss stats and the size cap
+def load_cached(session, **load_kwargs):
+    ensure_cache()
+
+    hit = is_cached(session)
+    with _lock:
+        _stats["hits" if hit else "misses"] += 1
+
+    if not hit and OFFLINE:
+        raise RuntimeError("session is not in the local cache and offline mode is enabled")
+
+    session.load(**load_kwargs)
+
+    path = session_cache_path(session)
+    if os.path.isdir(path):
+        # Directory mtime is used as the "last used" time for LRU eviction
+        os.utime(path)
+    enforce_size_limit(keep=path)
+
+    return session
+
+
+# Size in bytes of every file below path
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+# All cached session directories as (last_used, size, path)
+def _cached_sessions():
+    entries = []
+    if not os.path.isdir(CACHE_DIR):
+        return entries
+
+    for root, _, files in os.walk(CACHE_DIR):
+        if any(name.endswith(".ff1pkl") for name in files):
+            entries.append((os.path.getmtime(root), _dir_size(root), root))
+    return entries
+
+
+# Files of a cached session. Summary tables and the telemetry store (telemetry_v* folders)
+# are derived from the session and go with it
+def _remove_session_files(path):
+    for name in os.listdir(path):
+        item = os.path.join(path, name)
+        if os.path.isdir(item):
+            if name.startswith("telemetry_v"):
+                shutil.rmtree(item)
+        elif name.endswith((".ff1pkl", ".parquet", ".npy", ".json")):
+            os.remove(item)
+
+
+# Drop least recently used sessions until the cache fits in CACHE_MAX_MB
+def enforce_size_limit(keep=None):
+    max_bytes = CACHE_MAX_MB * 1024 * 1024
+
+    with _lock:
+        entries = sorted(_cached_sessions())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+                continue
+
+            try:
+                _remove_session_files(path)
+            except OSError as e:
+                # e.g. a file still open on Windows, the rest goes on the next eviction
+                logger.warning("Could not evict cached session %s: %s", path, e)
+                continue
+            total -= size
+            _stats["evictions"] += 1
+            _stats["evicted_bytes"] += size
+            logger.info("Evicted cached session %s (%.1f MB)", path, size / 1024 / 1024)
+
+
+# Snapshot of the disk cache counters and current size
+def get_cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        entries = _cached_sessions()
+
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["sessions"] = len(entries)
+    stats["size_bytes"] = sum(size for _, size, _ in entries)
+    stats["cache_dir"] = CACHE_DIR
+    stats["offline"] = OFFLINE
+    return stats
+
+
+'''------------------------------------------------------------------------------------'''
+
+'''SUMMARY TABLES'''
+
+# Parquet file of a summary table, next to the cached session data
+def summary_path(session, version, name):
+    return os.path.join(session_cache_path(session), f"summary_v{version}_{name}.parquet")
+
+# Summary tables called names saved by save_summary(), or None if any of them is missing or unreadable.
+# A partial set (e.g. a save interrupted halfway) is a miss, the caller recomputes all of them
+def load_summary(session, version, names):
+    import pandas as pd
+    path = session_cache_path(session)
+    if not os.path.isdir(path):
+        return None
+
+    if not all(os.path.isfile(summary_path(session, version, name)) for name in names):
+        return None
+
+    try:
+        return {name: pd.read_parquet(summary_path(session, version, name)) for name in names}
+    except Exception as e:
+        # No Parquet engine or a damaged file, the caller recomputes the tables
+        logger.warning("Could not read summary tables of %s: %s", session.api_path, e)
+        return None
+
+# Store summary tables as Parquet, only for sessions that are in the disk cache
+def save_summary(session, version, tables):
+    path = session_cache_path(session)
+    if not os.path.isdir(path):
+        return
+
+    try:
+        for name, table in tables.items():
+            target = summary_path(session, version, name)
+            # Write to a temporary file first so readers never see half a table
+            tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            table.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, target)
+    except Exception as e:
+        logger.warning("Could not save summary tables of %s: %s", session.api_path, e)
+
+
+'''------------------------------------------------------------------------------------'''
+
+'''IN-MEMORY SESSION CACHE'''
+
+# Approximate resident size in bytes of a loaded session
+def session_nbytes(session):
+    total = 0
+
+    # Laps and results are small but hold object columns, so measure them deeply
+    for attr in ("_laps", "_results", "_weather_data", "_race_control_messages", "_track_status"):
+        frame = getattr(session, attr, None)
+        if frame is not None and hasattr(frame, "memory_usage"):
+            total += int(frame.memory_usage(deep=True).sum())
+
+    # Telemetry is numeric and by far the largest part, a shallow count is enough
+    for attr in ("_car_data", "_pos_data"):
+        for frame in (getattr(session, attr, None) or {}).values():
+            total += int(frame.memory_usage(deep=False).sum())
+
+    # Summary tables of the ranking plots and race pace tables
+    for attr in ("_summary", "_race_pace"):
+        for frame in (getattr(session, attr, None) or {}).values():
+            total += int(frame.memory_usage(deep=True).sum())
+
+    # Telemetry store arrays, except memory-mapped ones which live in the page cache
+    store = getattr(session, "_telemetry_store", None)
+    if store is not None:
+        for array in (store.fastest, store.laps):
+            if array is not None and not hasattr(array, "filename"):
+                total += int(array.nbytes)
+
+    return total
+
+
+# Memory bounded LRU of loaded sessions, shared by every Streamlit rerun and user.
+# max_sessions also bounds the number of sessions, None for no limit
+class SessionLRU:
+    def __init__(self, max_bytes, max_sessions=None):
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self._entries = OrderedDict()  # key -> (session, nbytes)
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    # Lock serializing loads of the same key, so a session is only built once
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, session):
+        nbytes = session_nbytes(session)
+        with self._lock:
+            self._entries[key] = (session, nbytes)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    # Return the cached session for key, calling loader() on a miss.
+    # On a hit, upgrade(session) may load missing data in place and return True
+    def get_or_load(self, key, loader, upgrade=None):
+        with self._key_lock(key):
+            start = time.perf_counter()
+            session = self.get(key)
+            if session is not None:
+                with self._lock:
+                    self._stats["hits"] += 1
+                if upgrade is not None and upgrade(session):
+                    # The session grew, account for its new size
+                    self.put(key, session)
+                logger.info("Session %s served from memory in %.1f ms", key, (time.perf_counter() - start) * 1000)
+                return session
+
+            with self._lock:
+                self._stats["misses"] += 1
+
+            session = loader()
+            # Failed loads are not cached so they can be retried
+            if session is not None:
+                self.put(key, session)
+            return session
+
+    # Drop least recently used sessions until the budget fits, always keeping the newest one
+    def _evict(self):
+        total = sum(nbytes for _, nbytes in self._entries.values())
+        while len(self._entries) > 1 and (total > self.max_bytes or (self.max_sessions is not None and len(self._entries) > self.max_sessions)):
+            key, (_, nbytes) = self._entries.popitem(last=False)
+            total -= nbytes
+            self._stats["evictions"] += 1
+            logger.info("Evicted session %s from memory (%.1f MB)", key, nbytes / 1024 / 1024)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["sessions"] = len(self._entries)
+            stats["resident_bytes"] = sum(nbytes for _, nbytes in self._entries.values())
+
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["max_bytes"] = self.max_bytes
+        stats["max_sessions"] = self.max_sessions
+        return stats
+
+
+SESSIONS = SessionLRU(SESSION_MEMORY_MB * 1024 * 1024)
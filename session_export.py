@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import f1_analysis
+import session_cache
+import telemetry_store
+
+logger = logging.getLogger(__name__)
+
+# Bump when the files change, read_export() refuses other versions
+EXPORT_VERSION = 2
+
+# Spacing in meters of the distance grid of the exported telemetry
+TELEMETRY_GRID_STEP = 5.0
+
+TELEMETRY_CHANNELS = telemetry_store.CHANNELS
+
+# Sessions (fastf1 names) with a race pace export
+RACE_SESSIONS = ["Race", "Sprint"]
+
+# Laps columns by exported type. Lap and sector durations fit in float32 (microseconds at 100 s),
+# the session clock columns run for hours and stay float64 to keep millisecond precision
+LAP_CATEGORIES = ["Driver", "DriverNumber", "Team", "Compound", "TrackStatus"]
+LAP_FLOAT32 = ["LapNumber", "Stint", "TyreLife", "Position", "SpeedI1", "SpeedI2", "SpeedFL", "SpeedST"]
+LAP_DURATIONS = ["LapTime", "Sector1Time", "Sector2Time", "Sector3Time"]
+LAP_SESSION_TIMES = ["Time", "LapStartTime", "PitOutTime", "PitInTime",
+                     "Sector1SessionTime", "Sector2SessionTime", "Sector3SessionTime"]
+LAP_FLAGS = ["IsPersonalBest", "FreshTyre", "Deleted", "FastF1Generated", "IsAccurate"]
+
+
+# Laps with explicit compact dtypes, times in seconds
+def laps_table(session):
+    laps = session.laps
+    table = pd.DataFrame(index=range(len(laps)))
+
+    for column in LAP_CATEGORIES:
+        if column in laps:
+            table[column] = pd.Categorical(laps[column].to_numpy())
+    for column in LAP_FLOAT32:
+        if column in laps:
+            table[column] = pd.to_numeric(laps[column], errors="coerce").to_numpy(dtype=np.float32)
+    for column in LAP_DURATIONS:
+        if column in laps:
+            table[column] = laps[column].dt.total_seconds().to_numpy(dtype=np.float32)
+    for column in LAP_SESSION_TIMES:
+        if column in laps:
+            table[column] = laps[column].dt.total_seconds().to_numpy(dtype=np.float64)
+    for column in LAP_FLAGS:
+        if column in laps:
+            table[column] = laps[column].fillna(False).to_numpy(dtype=bool)
+    if "LapStartDate" in laps:
+        table["LapStartDate"] = laps["LapStartDate"].to_numpy()
+
+    return table
+
+
+# One row per driver: team, best lap, gap, top speed, laps driven and final position
+def drivers_table(session):
+    summary = f1_analysis.session_summary(session)
+    speeds = f1_analysis.max_speed_table(session)[["Driver", "MaxSpeedST"]]
+    laps = session.laps.groupby("Driver").size().rename("Laps").reset_index()
+    results = summary["results"][["Abbreviation", "Position"]].rename(columns={"Abbreviation": "Driver"})
+
+    table = (summary["drivers"].rename(columns={"LapTime": "BestLapTime"})
+             .merge(speeds, on="Driver", how="left")
+             .merge(laps, on="Driver", how="left")
+             .merge(results, on="Driver", how="left"))
+
+    return pd.DataFrame({
+        "Driver": pd.Categorical(table["Driver"]),
+        "Team": pd.Categorical(table["Team"]),
+        "BestLapTime": table["BestLapTime"].to_numpy(dtype=np.float32),
+        "Delta": table["Delta"].to_numpy(dtype=np.float32),
+        "MaxSpeedST": table["MaxSpeedST"].to_numpy(dtype=np.float32),
+        "Laps": table["Laps"].fillna(0).to_numpy(dtype=np.int16),
+        "Position": table["Position"].to_numpy(dtype=np.float32),
+    })
+
+
+# Fastest lap of every driver resampled every grid_step meters, in long format:
+# Driver, Distance and TELEMETRY_CHANNELS as float32, Time in seconds from the start of the lap.
+# Taken from the telemetry store (built if needed), so no telemetry is loaded for a stored session
+def telemetry_table(session, grid_step=TELEMETRY_GRID_STEP):
+    store = telemetry_store.telemetry_store(session)
+    # Laps need two points to be resampled
+    rows = [(row, info) for row, info in enumerate(store.drivers) if info["Points"] > 1]
+    if not rows:
+        return pd.DataFrame(columns=["Driver", "Distance"] + TELEMETRY_CHANNELS)
+
+    # One grid for the whole session, as long as the typical lap
+    lap_length = np.median([store.grid[info["Points"] - 1] for _, info in rows])
+    grid = np.arange(0, lap_length, grid_step)
+
+    frames = []
+    for row, info in rows:
+        points = info["Points"]
+        values = telemetry_store.resample_lap(store.grid[:points], store.fastest[:, row, :points], grid)
+
+        frame = pd.DataFrame(values.T, columns=TELEMETRY_CHANNELS)
+        frame.insert(0, "Distance", grid.astype(np.float32))
+        frame.insert(0, "Driver", info["Driver"])
+        frames.append(frame)
+
+    table = pd.concat(frames, ignore_index=True)
+    table["Driver"] = pd.Categorical(table["Driver"])
+    return table[["Driver", "Distance"] + TELEMETRY_CHANNELS]
+
+
+# Arrow column of a table column. Missing floats stay NaN instead of becoming Arrow nulls,
+# so numeric columns read back as views of the file without a pass filling the nulls
+def _arrow_column(column):
+    if pd.api.types.is_float_dtype(column.dtype):
+        return pa.array(column.to_numpy(), from_pandas=False)
+    return pa.Array.from_pandas(column)
+
+
+# Uncompressed Arrow IPC (Feather v2) file, which read_table() maps instead of decoding
+def _write_table(table, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    arrow_table = pa.table({str(name): _arrow_column(table[name]) for name in table.columns})
+    feather.write_feather(arrow_table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+# Write the processed data of a loaded session to folder:
+#   laps.arrow, drivers.arrow, telemetry.arrow (with telemetry=True),
+#   summary/<name>.arrow (the tables of the ranking plots), pace_laps.arrow and
+#   stints.arrow (races and sprints, see f1_analysis.race_pace) and meta.json
+def export_session(session, folder, telemetry=True, grid_step=TELEMETRY_GRID_STEP):
+    start = time.perf_counter()
+    os.makedirs(os.path.join(folder, "summary"), exist_ok=True)
+
+    _write_table(laps_table(session), os.path.join(folder, "laps.arrow"))
+    _write_table(drivers_table(session), os.path.join(folder, "drivers.arrow"))
+    for name, table in f1_analysis.session_summary(session).items():
+        _write_table(table, os.path.join(folder, "summary", f"{name}.arrow"))
+    if telemetry:
+        _write_table(telemetry_table(session, grid_step), os.path.join(folder, "telemetry.arrow"))
+    if session.name in RACE_SESSIONS:
+        pace = f1_analysis.race_pace(session)
+        _write_table(pace["laps"], os.path.join(folder, "pace_laps.arrow"))
+        _write_table(pace["stints"], os.path.join(folder, "stints.arrow"))
+
+    meta = {
+        "version": EXPORT_VERSION,
+        "summary_version": f1_analysis.SUMMARY_VERSION,
+        "api_path": session.api_path,
+        "event_name": session.event["EventName"],
+        "year": int(session.event.year),
+        "session_name": session.name,
+        "telemetry_grid_step": grid_step if telemetry else None,
+    }
+    with open(os.path.join(folder, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    logger.info("Exported %s %s to %s in %.2f s", meta["event_name"], meta["session_name"], folder, time.perf_counter() - start)
+    return folder
+
+
+# Reads a table of an export by memory-mapping the file: numeric columns are read-only views of
+# the mapped file, the pages are only read when used. Text and categorical columns are converted
+def read_table(path, columns=None):
+    arrow_table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    if columns is not None:
+        arrow_table = arrow_table.select(columns)
+    return arrow_table.to_pandas(split_blocks=True)
+
+
+# Event details of an exported session, indexable like a fastf1 Event
+class ExportedEvent(dict):
+    def __init__(self, name, year):
+        super().__init__(EventName=name)
+        self.year = year
+
+
+# A session read back from an export. laps, drivers and telemetry are read on first use;
+# the summary tables are loaded right away. The plots reading laps and summary tables (rankings,
+# Stint Comparison, Race Pace) draw straight from it, the telemetry plots need a fastf1 session
+class ExportedSession:
+    def __init__(self, folder):
+        with open(os.path.join(folder, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != EXPORT_VERSION:
+            raise ValueError(f"{folder} was exported with version {self.meta['version']}, expected {EXPORT_VERSION}")
+
+        self.folder = folder
+        self.api_path = self.meta["api_path"]
+        self.name = self.meta["session_name"]
+        self.event = ExportedEvent(self.meta["event_name"], self.meta["year"])
+        # Everything the plots reading session_summary() need
+        self.loaded_data = frozenset({f1_analysis.LAPS})
+        self._tables = {}
+
+        if self.meta["summary_version"] == f1_analysis.SUMMARY_VERSION:
+            summary_dir = os.path.join(folder, "summary")
+            self._summary = {name[:-len(".arrow")]: read_table(os.path.join(summary_dir, name))
+                             for name in os.listdir(summary_dir) if name.endswith(".arrow")}
+
+    def _table(self, name):
+        if name not in self._tables:
+            path = os.path.join(self.folder, f"{name}.arrow")
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"{path} was not exported")
+            self._tables[name] = read_table(path)
+        return self._tables[name]
+
+    # Laps as fastf1 Laps (pick_drivers() etc.) with the columns the plots expect: times back as
+    # timedeltas (the plots call .dt on them) and text instead of categoricals. read_table() of
+    # laps.arrow gives the compact columns, times in seconds
+    @property
+    def laps(self):
+        if "fastf1_laps" not in self._tables:
+            from fastf1.core import Laps
+
+            laps = self._table("laps").copy(deep=False)
+            for column in LAP_DURATIONS + LAP_SESSION_TIMES:
+                if column in laps:
+                    laps[column] = pd.to_timedelta(laps[column].astype(np.float64), unit="s")
+            for column in LAP_CATEGORIES:
+                if column in laps:
+                    laps[column] = laps[column].astype(object)
+            self._tables["fastf1_laps"] = Laps(laps, session=self)
+        return self._tables["fastf1_laps"]
+
+    @property
+    def drivers(self):
+        return self._table("drivers")
+
+    @property
+    def telemetry(self):
+        return self._table("telemetry")
+
+    @property
+    def stints(self):
+        return self._table("stints")
+
+
+def read_export(folder):
+    return ExportedSession(folder)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the processed data of a session to Arrow files.")
+    parser.add_argument("year", type=int)
+    parser.add_argument("grand_prix", help="e.g. Monaco")
+    parser.add_argument("session_type", choices=list(f1_analysis.SESSION_NAMES), metavar="SESSION",
+                        help=f"one of {', '.join(f1_analysis.SESSION_NAMES)}")
+    parser.add_argument("--out", default="exports", help="output folder (default: ./exports)")
+    parser.add_argument("--no-telemetry", action="store_true", help="skip the fastest lap telemetry, no telemetry download needed")
+    parser.add_argument("--grid-step", type=float, default=TELEMETRY_GRID_STEP, help="telemetry resolution in meters")
+    parser.add_argument("--cache-dir", help="fastf1 cache folder")
+    parser.add_argument("--offline", action="store_true", help="only use sessions already in the cache")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    session_cache.configure_cache(args.cache_dir, offline=args.offline or None)
+
+    requirements = {f1_analysis.LAPS} if args.no_telemetry else {f1_analysis.LAPS, f1_analysis.TELEMETRY}
+    session = f1_analysis.load_session("Grand Prix", args.year, args.grand_prix, args.session_type, requirements)
+    if session is None:
+        print(f"{args.year} {args.grand_prix} {args.session_type} is not available")
+        return 1
+
+    folder = os.path.join(args.out, str(args.year), args.grand_prix.replace(" ", "_"), args.session_type.replace(" ", "_"))
+    export_session(session, folder, telemetry=not args.no_telemetry, grid_step=args.grid_step)
+    print(f"Exported to {folder}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
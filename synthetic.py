@@ -0,0 +1,288 @@
+import sys
+import time
+import math
+import argparse
+import numpy as np
+import pandas as pd
+
+# Synthetic sessions: fastf1 Laps, Telemetry and SessionResults built from a made-up circuit,
+# so the plots run at any scale (drivers, laps, telemetry rate) without downloading anything.
+#   session = SyntheticSession(n_drivers=100, n_laps=50, hz=50)
+#   fig = f1_analysis.plot_stint_comparison(session, ["AAA", "BBB"], team_colors)
+
+TRACK_LENGTH = 5000.0
+TEAMS = ["Red Bull Racing", "Ferrari", "Mercedes", "McLaren", "Aston Martin",
+         "Alpine", "Williams", "RB", "Kick Sauber", "Haas F1 Team"]
+COMPOUNDS = ["SOFT", "MEDIUM", "HARD"]
+START = pd.Timestamp("2024-05-26 13:00:00")
+
+# Lap time effects, in seconds: tyre age (per lap), fuel (per lap left in races), pit lane.
+# The fuel effect is the default of the race pace fuel correction, 0.03 s/kg and 1.7 kg per lap
+DEGRADATION_S_PER_LAP = 0.05
+FUEL_S_PER_LAP = 0.051
+PIT_IN_LOSS_S = 20.0
+PIT_OUT_LOSS_S = 2.0
+
+# Position data lags the car data, like the real feeds
+POS_DELAY = pd.Timedelta(milliseconds=110)
+
+
+def _track_xy(distance):
+    theta = 2 * np.pi * distance / TRACK_LENGTH
+    return 3000 * np.cos(theta) + 600 * np.cos(3 * theta), 1800 * np.sin(theta) + 400 * np.sin(2 * theta)
+
+
+def _seconds(values):
+    return pd.to_timedelta(values, unit="s")
+
+
+# Speed in km/h along a lap at the nominal pace
+def _speed_profile(distance):
+    theta = 2 * np.pi * distance / TRACK_LENGTH
+    return 220 + 80 * np.cos(5 * theta) + 20 * np.sin(2 * theta)
+
+
+# Three letter codes, then D027, D028... past the alphabet
+def driver_codes(n_drivers):
+    return [chr(65 + i) * 3 if i < 26 else f"D{i + 1:03d}" for i in range(n_drivers)]
+
+
+def _event(name):
+    from fastf1.events import Event
+    return Event({"EventName": name, "Country": "Synthetic", "Location": "Synthetic",
+                  "RoundNumber": 1, "EventDate": START}, year=START.year)
+
+
+# A session of n_drivers drivers doing n_laps laps each (default: 57 in races, 12 otherwise),
+# with telemetry sampled at hz. Teammates share a team, every driver has a pace of their own,
+# races have fuel, tyre degradation and two pit stops per driver
+class SyntheticSession:
+    def __init__(self, n_drivers=20, n_laps=None, hz=4.0, name="Race", seed=0, telemetry=True):
+        import f1_analysis
+        from fastf1.core import Laps
+
+        rng = np.random.default_rng(seed)
+        self.name = name
+        self.event = _event("Synthetic Grand Prix")
+        self.api_path = f"/static/synthetic/{name.replace(' ', '_')}_{n_drivers}_{n_laps}_{hz}_{seed}/"
+        self.race = name in ("Race", "Sprint")
+        n_laps = n_laps or (57 if self.race else 12)
+
+        # Reference lap: time to cover the circuit at the nominal speed
+        self._grid = np.linspace(0, TRACK_LENGTH, 2001)
+        step_times = np.diff(self._grid) / (_speed_profile(self._grid[:-1]) / 3.6)
+        self._ref_time = np.concatenate([[0.0], np.cumsum(step_times)])
+
+        drivers = driver_codes(n_drivers)
+        numbers = [str(i + 1) for i in range(n_drivers)]
+        teams = [TEAMS[(i // 2) % len(TEAMS)] for i in range(n_drivers)]
+        skill = rng.normal(1.0, 0.006, n_drivers)
+
+        frames = []
+        self.car_data, self.pos_data = {}, {}
+        for i in range(n_drivers):
+            laps = self._driver_laps(rng, n_laps, skill[i])
+            laps["Driver"], laps["DriverNumber"], laps["Team"] = drivers[i], numbers[i], teams[i]
+            frames.append(laps)
+            if telemetry:
+                self._add_telemetry(numbers[i], laps, hz)
+
+        laps = pd.concat(frames, ignore_index=True)
+        # Personal best: the quickest lap that is not an in or out lap
+        valid = laps["PitInTime"].isna() & laps["PitOutTime"].isna()
+        laps.loc[laps[valid].groupby("Driver")["LapTime"].idxmin().to_numpy(), "IsPersonalBest"] = True
+        if self.race:
+            laps["Position"] = laps.groupby("LapNumber")["Time"].rank(method="first")
+
+        self.laps = Laps(laps, session=self)
+        self.results = self._results(laps, drivers, numbers, teams)
+        self.drivers = numbers
+        self.session_info = {}
+        self.t0_date = START
+        self.loaded_data = f1_analysis.ALL_DATA
+
+    def _driver_laps(self, rng, n_laps, skill):
+        lap_number = np.arange(1, n_laps + 1)
+        ref_lap = self._ref_time[-1]
+
+        pit_in = np.zeros(n_laps, dtype=bool)
+        if self.race and n_laps > 20:
+            pit_in[rng.choice(np.arange(9, n_laps - 5), size=2, replace=False)] = True
+        pit_out = np.concatenate([[not self.race], pit_in[:-1]])
+        stint = 1 + np.concatenate([[0], np.cumsum(pit_in)[:-1]])
+        stint_start = np.flatnonzero(np.concatenate([[True], np.diff(stint) > 0]))
+        tyre_life = lap_number - stint_start[stint - 1]
+
+        lap_time = (ref_lap * skill * (1 + rng.normal(0, 0.004, n_laps)) + DEGRADATION_S_PER_LAP * tyre_life
+                    + (FUEL_S_PER_LAP * (n_laps - lap_number) if self.race else 0.0)
+                    + PIT_IN_LOSS_S * pit_in + PIT_OUT_LOSS_S * (pit_out & (lap_number > 1)))
+        end = np.cumsum(lap_time)
+        start = end - lap_time
+
+        # Sectors end at a third and two thirds of the circuit, on the lap's own pace
+        scale = lap_time / ref_lap
+        sector_ends = np.interp([TRACK_LENGTH / 3, 2 * TRACK_LENGTH / 3], self._grid, self._ref_time)
+        sector1, sector2 = sector_ends[0] * scale, (sector_ends[1] - sector_ends[0]) * scale
+
+        return pd.DataFrame({
+            "Time": _seconds(end), "LapTime": _seconds(lap_time), "LapNumber": lap_number.astype(float),
+            "Stint": stint.astype(float),
+            "PitOutTime": _seconds(np.where(pit_out, start, np.nan)), "PitInTime": _seconds(np.where(pit_in, end, np.nan)),
+            "Sector1Time": _seconds(sector1), "Sector2Time": _seconds(sector2), "Sector3Time": _seconds(lap_time - sector1 - sector2),
+            "Sector1SessionTime": _seconds(start + sector1), "Sector2SessionTime": _seconds(start + sector1 + sector2),
+            "Sector3SessionTime": _seconds(end),
+            "SpeedI1": np.nan, "SpeedI2": np.nan, "SpeedFL": np.nan, "SpeedST": 300 / scale + rng.normal(0, 2, n_laps),
+            "IsPersonalBest": False, "Compound": np.array(COMPOUNDS)[(stint - 1) % len(COMPOUNDS)],
+            "TyreLife": tyre_life.astype(float), "FreshTyre": True,
+            "LapStartTime": _seconds(start), "LapStartDate": START + _seconds(start),
+            "TrackStatus": "1", "Position": np.nan, "Deleted": False, "DeletedReason": "",
+            "FastF1Generated": False, "IsAccurate": ~(pit_in | pit_out),
+        })
+
+    # Car and position data at hz over all the laps of a driver, sampled uniformly in time
+    # and placed on the circuit with the pace of the lap they fall in
+    def _add_telemetry(self, number, laps, hz):
+        from fastf1.core import Telemetry
+
+        start = laps["LapStartTime"].dt.total_seconds().to_numpy()
+        end = laps["Time"].dt.total_seconds().to_numpy()
+        t = np.arange(0, math.floor(end[-1] * hz) + 1) / hz
+
+        lap = np.clip(np.searchsorted(end, t, side="left"), 0, len(end) - 1)
+        scale = (end - start) / self._ref_time[-1]
+        distance = np.interp((t - start[lap]) / scale[lap], self._ref_time, self._grid)
+
+        speed = _speed_profile(distance)
+        throttle = np.clip((speed - 160) * 1.2, 0, 100)
+        session_time = pd.to_timedelta(t, unit="s")
+        car = pd.DataFrame({
+            "Date": START + session_time, "SessionTime": session_time, "Time": session_time,
+            "Speed": speed, "RPM": 8000 + 20 * speed, "nGear": np.clip((speed // 45).astype(int) + 1, 1, 8),
+            "Throttle": throttle, "Brake": throttle < 5, "DRS": np.zeros(len(t), dtype=int), "Source": "car",
+        })
+        x, y = _track_xy(distance)
+        pos = pd.DataFrame({
+            "Date": START + session_time + POS_DELAY, "SessionTime": session_time + POS_DELAY, "Time": session_time,
+            "X": x, "Y": y, "Z": np.zeros(len(t)), "Status": "OnTrack", "Source": "pos",
+        })
+        self.car_data[number] = Telemetry(car, session=self, driver=number)
+        self.pos_data[number] = Telemetry(pos, session=self, driver=number)
+
+    # Classification: race order by finishing time with gaps to the winner, best lap otherwise
+    def _results(self, laps, drivers, numbers, teams):
+        from fastf1.core import SessionResults
+
+        if self.race:
+            finish = laps.groupby("Driver")["Time"].max().sort_values()
+            times = (finish - finish.iloc[0]).mask(finish.index == finish.index[0], finish.iloc[0])
+        else:
+            finish = laps.groupby("Driver")["LapTime"].min().sort_values()
+            times = pd.Series(pd.NaT, index=finish.index, dtype="timedelta64[ns]")
+
+        order = [drivers.index(driver) for driver in finish.index]
+        return SessionResults(pd.DataFrame({
+            "DriverNumber": [numbers[i] for i in order], "Abbreviation": list(finish.index),
+            "TeamName": [teams[i] for i in order], "Position": np.arange(1, len(order) + 1, dtype=float),
+            "Time": times.to_numpy(), "Status": "Finished",
+        }))
+
+    # Ten corners spread evenly around the circuit
+    def get_circuit_info(self):
+        from fastf1.mvapi.data import CircuitInfo
+
+        distance = np.linspace(0, TRACK_LENGTH, 13)[1:-1]
+        x, y = _track_xy(distance)
+        corners = pd.DataFrame({"X": x, "Y": y, "Number": np.arange(1, len(distance) + 1), "Letter": "",
+                                "Angle": 0.0, "Distance": distance})
+        empty = corners.iloc[0:0]
+        return CircuitInfo(corners=corners, marshal_lights=empty, marshal_sectors=empty, rotation=0.0)
+
+
+'''------------------------------------------------------------------------------------'''
+
+'''SCALING'''
+
+# Slower than proportional to the size by more than this exponent is reported (2 = quadratic)
+SUPERLINEAR_EXPONENT = 1.3
+
+
+# Sizes of a sweep as dicts of n_drivers, n_laps and hz: the first value of every dimension,
+# then one dimension at a time through its other values
+def sweep_points(drivers, laps, hz):
+    base = {"n_drivers": drivers[0], "n_laps": laps[0], "hz": hz[0]}
+    points = [base]
+    for key, values in (("n_drivers", drivers), ("n_laps", laps), ("hz", hz)):
+        points += [{**base, key: value} for value in values[1:]]
+    return points
+
+
+# Seconds to build the session and to draw and encode every plot of its type, at one size.
+# The multi-driver plots compare the whole grid
+def time_point(session_type, point, seed=0):
+    import f1_analysis
+    import figures
+    import bench_sessions
+
+    start = time.perf_counter()
+    session = SyntheticSession(name=f1_analysis.SESSION_NAMES[session_type], seed=seed, **point)
+    timings = {"build": time.perf_counter() - start}
+
+    for plot_name, args in bench_sessions.fixture_plots(session, session_type, group_size=None)[1]:
+        start = time.perf_counter()
+        with figures.closing(getattr(f1_analysis, plot_name)(session, *args)) as fig:
+            if fig is not None:
+                f1_analysis.figure_bytes(fig)
+        timings[plot_name] = time.perf_counter() - start
+    return timings
+
+
+# Growth exponents of every stage along each swept dimension: log(time ratio) / log(size ratio)
+# between the base and each larger point, as [(stage, dimension, from, to, exponent)]
+def scaling_exponents(points, timings):
+    base = points[0]
+    exponents = []
+    for point, timing in zip(points[1:], timings[1:]):
+        key = next(key for key in point if point[key] != base[key])
+        for stage, seconds in timing.items():
+            if stage in timings[0] and timings[0][stage] > 0 and seconds > 0:
+                exponent = math.log(seconds / timings[0][stage]) / math.log(point[key] / base[key])
+                exponents.append((stage, key, base[key], point[key], exponent))
+    return exponents
+
+
+def main(argv=None):
+    import f1_analysis
+
+    parser = argparse.ArgumentParser(description="Time the plots on synthetic sessions of growing size and flag super-linear growth.")
+    parser.add_argument("--session", default="Race", choices=list(f1_analysis.SESSION_NAMES), metavar="SESSION",
+                        help=f"session type whose plots are timed, one of {', '.join(f1_analysis.SESSION_NAMES)}")
+    parser.add_argument("--drivers", type=int, nargs="+", default=[20, 100], help="numbers of drivers, the first one is the base")
+    parser.add_argument("--laps", type=int, nargs="+", default=[57, 500], help="laps per driver, the first one is the base")
+    parser.add_argument("--hz", type=float, nargs="+", default=[4.0, 50.0], help="telemetry sample rates, the first one is the base")
+    parser.add_argument("--threshold", type=float, default=SUPERLINEAR_EXPONENT, help="growth exponent reported as super-linear")
+    args = parser.parse_args(argv)
+
+    import matplotlib
+    matplotlib.use("Agg")
+
+    points = sweep_points(args.drivers, args.laps, args.hz)
+    # Imports and first-use costs (seaborn, fonts) would count against the base size
+    time_point(args.session, points[0])
+
+    timings = []
+    for point in points:
+        timing = time_point(args.session, point)
+        timings.append(timing)
+        print(f"{point['n_drivers']} drivers, {point['n_laps']} laps, {point['hz']:g} Hz: "
+              + ", ".join(f"{stage} {seconds:.2f} s" for stage, seconds in timing.items()))
+
+    flagged = 0
+    for stage, key, before, after, exponent in scaling_exponents(points, timings):
+        flag = exponent > args.threshold
+        flagged += flag
+        print(f"{'SUPER-LINEAR ' if flag else ''}{stage}: {key} {before:g} -> {after:g}, time ~ size^{exponent:.2f}")
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
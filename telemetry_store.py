@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import numpy as np
+import f1_analysis
+import session_cache
+import timing
+
+logger = logging.getLogger(__name__)
+
+# Bump when the arrays change, files of other versions are rebuilt
+STORE_VERSION = 3
+
+# Spacing in meters of the distance grid shared by every lap of a circuit
+GRID_STEP = float(os.environ.get("F1_TELEMETRY_GRID_STEP", "2.0"))
+# The grid is built by the first session of an event, and runs a bit longer than its longest lap
+GRID_MARGIN = 1.05
+
+# Channels of the store, Time in seconds from the start of the lap
+CHANNELS = ["Speed", "Throttle", "Brake", "nGear", "RPM", "X", "Y", "Time"]
+CHANNEL_INDEX = {name: i for i, name in enumerate(CHANNELS)}
+
+# Discrete channels are rounded after resampling, they are not meant to be averaged between two samples
+DISCRETE_CHANNELS = ["Brake", "nGear"]
+
+_store_lock = threading.Lock()
+
+
+# Telemetry of laps resampled on the distance grid of the circuit.
+# Arrays are float32 with shape (channel, lap, point), memory-mapped when the store is on disk,
+# so comparing drivers is slicing rows of the same block
+class TelemetryStore:
+    def __init__(self, grid, fastest, drivers, laps=None, lap_index=None):
+        self.grid = grid
+        self.fastest = fastest
+        # One dict per row of fastest: Driver, Team, LapNumber, LapTime, Sector1-3Time,
+        # Sector1Distance, Sector2Distance and Points (grid points covered by the lap)
+        self.drivers = drivers
+        self.laps = laps
+        # One dict per row of laps: Driver, LapNumber, Points
+        self.lap_index = lap_index
+        self._rows = {info["Driver"]: row for row, info in enumerate(drivers)}
+
+    def has_driver(self, driver):
+        return driver in self._rows
+
+    # Fastest lap details of a driver, or None if the driver has no timed lap
+    def driver_info(self, driver):
+        row = self._rows.get(driver)
+        return None if row is None else self.drivers[row]
+
+    # A channel of the fastest lap of drivers, shape (len(drivers), points).
+    # points defaults to the whole grid, beyond the end of its lap a channel keeps its last value
+    def channel(self, name, drivers, points=None):
+        rows = [self._rows[driver] for driver in drivers]
+        return self.fastest[CHANNEL_INDEX[name], rows, :points]
+
+    # Grid points covered by the fastest laps of all drivers
+    def common_points(self, drivers):
+        return min(self.driver_info(driver)["Points"] for driver in drivers)
+
+    # A channel of every stored lap of a driver as (lap numbers, array (laps, points)), needs all_laps=True
+    def lap_channel(self, name, driver):
+        if self.laps is None:
+            raise ValueError("The store was built without all_laps")
+        rows = [row for row, info in enumerate(self.lap_index) if info["Driver"] == driver]
+        return [self.lap_index[row]["LapNumber"] for row in rows], self.laps[CHANNEL_INDEX[name], rows]
+
+    # Index of the grid point closest to distance
+    def point_at(self, distance):
+        return int(np.clip(np.rint(distance / GRID_STEP), 0, len(self.grid) - 1))
+
+
+'''------------------------------------------------------------------------------------'''
+
+'''FILES'''
+
+# Every save goes to a new folder inside this one, and the CURRENT file names the complete one.
+# Readers therefore see either the old store or the new one, never the arrays of one with the index of the other
+def _store_dir(session):
+    return os.path.join(session_cache.session_cache_path(session), f"telemetry_v{STORE_VERSION}")
+
+def _current_store(session):
+    try:
+        with open(os.path.join(_store_dir(session), "CURRENT")) as f:
+            return os.path.join(_store_dir(session), f.read().strip())
+    except OSError:
+        return None
+
+# All the sessions of an event run on the same circuit, the grid lives in the event folder.
+# One grid per GRID_STEP, so changing F1_TELEMETRY_GRID_STEP never reuses a grid of another step
+def _grid_path(session):
+    event_dir = os.path.dirname(os.path.normpath(session_cache.session_cache_path(session)))
+    return os.path.join(event_dir, f"telemetry_grid_v{STORE_VERSION}_{GRID_STEP:g}m.npy")
+
+# Write to a temporary file first so readers never see half an array
+def _save_array(path, array):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+# Distance grid of the circuit: the saved one if another session of the event built it,
+# otherwise a new one with some margin over the longest of lap_lengths
+def circuit_grid(session, lap_lengths):
+    path = _grid_path(session)
+    if os.path.isfile(path):
+        grid = np.load(path)
+        # Same step, unless the file was written by hand
+        if len(grid) > 1 and np.isclose(grid[1] - grid[0], GRID_STEP):
+            return grid
+        logger.warning("Ignoring %s, its step is not %g m", path, GRID_STEP)
+
+    grid = np.arange(0, max(lap_lengths) * GRID_MARGIN + GRID_STEP, GRID_STEP, dtype=np.float32)
+    if os.path.isdir(os.path.dirname(path)):
+        _save_array(path, grid)
+    return grid
+
+# Store saved by save_store(), memory-mapped, or None if it is missing or outdated
+def load_store(session):
+    folder = _current_store(session)
+    if folder is None or not os.path.isfile(_grid_path(session)):
+        return None
+
+    try:
+        with open(os.path.join(folder, "index.json")) as f:
+            index = json.load(f)
+        if index["grid_step"] != GRID_STEP:
+            return None
+
+        grid = np.load(_grid_path(session), mmap_mode="r")
+        fastest = np.load(os.path.join(folder, "fastest.npy"), mmap_mode="r")
+        laps = np.load(os.path.join(folder, "laps.npy"), mmap_mode="r") if index["laps"] is not None else None
+    except Exception as e:
+        logger.warning("Could not read the telemetry store of %s: %s", session.api_path, e)
+        return None
+
+    if fastest.shape[2] != len(grid):
+        return None
+    return TelemetryStore(grid, fastest, index["drivers"], laps, index["laps"])
+
+# Save a store next to the cached session data, only for sessions that are in the disk cache.
+# The files are written to a folder of their own, which CURRENT then points to in one replace.
+# Returns True if it was saved
+def save_store(session, store):
+    if not os.path.isdir(session_cache.session_cache_path(session)):
+        return False
+
+    store_dir = _store_dir(session)
+    name = f"{time.time_ns()}-{os.getpid()}-{threading.get_ident()}"
+    tmp_folder = os.path.join(store_dir, f"{name}.tmp")
+    try:
+        os.makedirs(tmp_folder)
+        np.save(os.path.join(tmp_folder, "fastest.npy"), store.fastest)
+        if store.laps is not None:
+            np.save(os.path.join(tmp_folder, "laps.npy"), store.laps)
+        with open(os.path.join(tmp_folder, "index.json"), "w") as f:
+            json.dump({
+                "version": STORE_VERSION,
+                "grid_step": GRID_STEP,
+                "channels": CHANNELS,
+                "drivers": store.drivers,
+                "laps": store.lap_index,
+            }, f)
+        os.rename(tmp_folder, os.path.join(store_dir, name))
+
+        current_path = os.path.join(store_dir, "CURRENT")
+        tmp_path = f"{current_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(name)
+        os.replace(tmp_path, current_path)
+    except Exception as e:
+        logger.warning("Could not save the telemetry store of %s: %s", session.api_path, e)
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        return False
+
+    _remove_old_stores(session)
+    return True
+
+# Folders of stores replaced since. Stores being written are left alone, and on Windows the ones
+# still memory-mapped can't be removed, the next save tries again
+def _remove_old_stores(session):
+    current = _current_store(session)
+    store_dir = _store_dir(session)
+    for name in os.listdir(store_dir):
+        path = os.path.join(store_dir, name)
+        if path != current and os.path.isdir(path) and not name.endswith(".tmp"):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+'''------------------------------------------------------------------------------------'''
+
+'''BUILD'''
+
+# CHANNELS of a telemetry frame as rows, Time in seconds from its first sample
+def telemetry_channels(telemetry):
+    seconds = telemetry["Time"].dt.total_seconds().to_numpy()
+    return np.vstack([telemetry[name].to_numpy(dtype=float) for name in CHANNELS[:-1]] + [seconds - seconds[0]])
+
+# CHANNELS sampled at distance resampled on the grid, as float32 (channel, point)
+def resample_lap(distance, channels, grid):
+    values = f1_analysis.resample_channels(distance, channels, grid).astype(np.float32)
+
+    for name in DISCRETE_CHANNELS:
+        np.rint(values[CHANNEL_INDEX[name]], out=values[CHANNEL_INDEX[name]])
+    return values
+
+# Grid points covered by a lap of the given length
+def _points(grid, lap_length):
+    return int(np.searchsorted(grid, lap_length, side="right"))
+
+def _seconds(value):
+    return float("nan") if value != value else value.total_seconds()
+
+# Fastest laps of drivers as (grid, array (channel, driver, point), driver details).
+# grid is None for a new store, it is then taken from the circuit
+def _build_fastest(session, drivers, grid=None):
+    f1_analysis.ensure_session_data(session, {f1_analysis.TELEMETRY})
+
+    fastest = {}
+    for driver in drivers:
+        # The store keeps the resampled arrays, the merged frames are dropped once resampled
+        lap = f1_analysis.fastest_lap_telemetry(session, driver)
+        if lap is not None:
+            fastest[driver] = lap
+    if grid is None:
+        # Without any timed lap there is nothing to put on a grid yet
+        grid = circuit_grid(session, [lap["telemetry"]["Distance"].max() for lap in fastest.values()]) if fastest else np.zeros(0, dtype=np.float32)
+
+    array = np.empty((len(CHANNELS), len(fastest), len(grid)), dtype=np.float32)
+    details = []
+    for row, (driver, lap) in enumerate(fastest.items()):
+        telemetry = lap["telemetry"]
+        array[:, row] = resample_lap(telemetry["Distance"].to_numpy(), telemetry_channels(telemetry), grid)
+        lapdata = lap["lap"]
+        details.append({
+            "Driver": driver,
+            "Team": lapdata["Team"],
+            "LapNumber": int(lapdata["LapNumber"]),
+            "LapTime": _seconds(lapdata["LapTime"]),
+            "Sector1Time": _seconds(lapdata["Sector1Time"]),
+            "Sector2Time": _seconds(lapdata["Sector2Time"]),
+            "Sector3Time": _seconds(lapdata["Sector3Time"]),
+            "Sector1Distance": float(lap["sector1_distance"]),
+            "Sector2Distance": float(lap["sector2_distance"]),
+            "Points": _points(grid, telemetry["Distance"].max()),
+        })
+    return grid, array, details
+
+# Every timed lap out of the pits. One telemetry frame per driver, cut into laps by session time,
+# with the distance integrated from the speed like Telemetry.add_distance() does
+def _build_laps(session, grid):
+    laps = session.laps.pick_wo_box()
+    laps = laps[laps["LapTime"].notna()]
+
+    rows = []
+    for driver in laps["Driver"].unique():
+        driver_laps = laps.pick_drivers(driver)
+        try:
+            telemetry = driver_laps.get_telemetry()
+        except Exception as e:
+            logger.warning("No telemetry for the laps of %s: %s", driver, e)
+            continue
+
+        channels = telemetry_channels(telemetry)
+        session_time = telemetry["SessionTime"].dt.total_seconds().to_numpy()
+        starts = np.searchsorted(session_time, driver_laps["LapStartTime"].dt.total_seconds().to_numpy())
+        ends = np.searchsorted(session_time, driver_laps["Time"].dt.total_seconds().to_numpy(), side="right")
+
+        for lap_number, start, end in zip(driver_laps["LapNumber"], starts, ends):
+            if end - start < 2:
+                continue
+            lap_channels = channels[:, start:end].copy()
+            lap_channels[-1] -= lap_channels[-1, 0]
+            speed = lap_channels[CHANNEL_INDEX["Speed"]]
+            distance = np.concatenate([[0.0], np.cumsum(speed[1:] / 3.6 * np.diff(lap_channels[-1]))])
+
+            rows.append(({"Driver": driver, "LapNumber": int(lap_number), "Points": _points(grid, distance[-1])},
+                         resample_lap(distance, lap_channels, grid)))
+
+    array = np.empty((len(CHANNELS), len(rows), len(grid)), dtype=np.float32)
+    for row, (_, values) in enumerate(rows):
+        array[:, row] = values
+    return array, [details for details, _ in rows]
+
+# store with the fastest laps of drivers it lacks and, with all_laps, every lap.
+# Returns None when there is nothing to add
+def extend_store(session, store, drivers, all_laps=False):
+    grid, fastest, details = _build_fastest(session, drivers, None if store is None else store.grid)
+    if store is not None:
+        fastest = np.concatenate([store.fastest, fastest], axis=1)
+        details = store.drivers + details
+
+    laps, lap_index = (None, None) if store is None else (store.laps, store.lap_index)
+    if all_laps and laps is None and len(grid):
+        laps, lap_index = _build_laps(session, grid)
+
+    if store is not None and len(details) == len(store.drivers) and laps is store.laps:
+        return None
+    return TelemetryStore(grid, fastest, details, laps, lap_index)
+
+
+# Telemetry store of a session with the fastest laps of drivers (default: all of them),
+# from memory, from disk or built and saved. Drivers missing from the store are added
+# on first use, the session keeps it so every plot slices the same arrays
+def telemetry_store(session, drivers=None, all_laps=False):
+    if drivers is None:
+        drivers = session.laps["Driver"].dropna().unique()
+
+    with _store_lock:
+        store = session.__dict__.get("_telemetry_store") or load_store(session)
+
+        missing = [driver for driver in drivers if store is None or not store.has_driver(driver)]
+        if missing or (all_laps and (store is None or store.laps is None)):
+            with timing.span("telemetry_store.build"):
+                extended = extend_store(session, store, missing, all_laps)
+            if extended is not None:
+                store = extended
+                # Reopen memory-mapped, the built arrays don't need to stay in memory
+                if len(store.grid) and save_store(session, store):
+                    store = load_store(session) or store
+
+        session._telemetry_store = store
+        return store
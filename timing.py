@@ -0,0 +1,148 @@
+import os
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Dump a profile of every request: "cprofile" (.prof, e.g. for snakeviz) or "pyinstrument" (.html), empty for none
+PROFILE_MODE = os.environ.get("F1_PROFILE", "").strip().lower()
+PROFILE_DIR = os.environ.get("F1_PROFILE_DIR", "profiles")
+
+_local = threading.local()
+
+
+# Spans are dicts: {"name": str, "seconds": float, "depth": int}, depth 0 for the outermost ones.
+# They only cost a clock read when somebody collects them
+@contextmanager
+def span(name):
+    listener = getattr(_local, "listener", None)
+    if listener is not None:
+        listener(name)
+
+    collectors = getattr(_local, "collectors", None)
+    if not collectors:
+        yield
+        return
+
+    _local.depth = getattr(_local, "depth", 0) + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+        collectors[-1].append({"name": name, "seconds": time.perf_counter() - start, "depth": _local.depth})
+
+
+# Decorator timing every call of a function as one span, named after the function by default
+def timed(name=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Collect the spans closed by this thread inside the block:
+#   with timing.collect() as spans:
+#       session = load_session(...)
+@contextmanager
+def collect():
+    spans = []
+    if not hasattr(_local, "collectors"):
+        _local.collectors = []
+
+    _local.collectors.append(spans)
+    try:
+        yield spans
+    finally:
+        _local.collectors.pop()
+
+
+# Call listener(name) whenever a span of this thread starts inside the block, e.g. to show progress
+@contextmanager
+def listen(listener):
+    previous = getattr(_local, "listener", None)
+    _local.listener = listener
+    try:
+        yield
+    finally:
+        _local.listener = previous
+
+
+# Add spans measured elsewhere (e.g. in a worker process) to the current collector
+def record(spans):
+    collectors = getattr(_local, "collectors", None)
+    if collectors and spans:
+        collectors[-1].extend(spans)
+
+
+# One row per span name, in order of first appearance: Stage, Calls, Total (ms), Mean (ms), Depth.
+# Spans of workers ran in parallel, so totals can add up to more than the request took
+def summarize(spans):
+    rows = {}
+    for item in spans:
+        row = rows.setdefault(item["name"], {"Stage": item["name"], "Calls": 0, "Total (ms)": 0.0, "Depth": item["depth"]})
+        row["Calls"] += 1
+        row["Total (ms)"] += item["seconds"] * 1000
+        row["Depth"] = min(row["Depth"], item["depth"])
+
+    # Inner spans close first, list the stages from the outside in
+    table = sorted(rows.values(), key=lambda row: row["Depth"])
+    for row in table:
+        row["Mean (ms)"] = row["Total (ms)"] / row["Calls"]
+    return table
+
+
+# Timing report of a request: its label, wall time and summarized spans, also logged
+def report(spans, label, wall_s):
+    table = summarize(spans)
+    logger.info("%s took %.2f s: %s", label, wall_s,
+                ", ".join(f"{row['Stage']} {row['Total (ms)']:.0f} ms" for row in table if row["Depth"] == 0) or "no spans")
+    return {"label": label, "wall_s": wall_s, "stages": table}
+
+
+# Profile the block with PROFILE_MODE and write the result to PROFILE_DIR, nothing if profiling is off
+@contextmanager
+def profile(label):
+    if PROFILE_MODE not in ("cprofile", "pyinstrument"):
+        yield None
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{''.join(c if c.isalnum() else '_' for c in label)}")
+
+    if PROFILE_MODE == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("F1_PROFILE=pyinstrument needs pyinstrument (pip install pyinstrument), not profiling")
+            yield None
+            return
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+            path += ".html"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            logger.info("Profile of %s written to %s", label, path)
+        return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        path += ".prof"
+        profiler.dump_stats(path)
+        logger.info("Profile of %s written to %s", label, path)